@@ -0,0 +1,245 @@
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+import gzip
+import re
+
+
+# The value rules of pdbecif's MMCIF2Dict, so that both give the same values:
+# a quote only ends a value when whitespace follows it.
+VALUE_PATTERN = re.compile(r'\s*(\'[\S\s]+?\'(?=\s)|"[\S\s]+?"(?=\s)|[\S]+)', re.M)
+
+
+# Maps category names to the items to keep, None keeps all of them.
+CategorySelection = Dict[str, Optional[List[str]]]
+
+
+LINE_BATCH_SIZE = 4096
+
+
+# Lines starting with these need a closer look, even in the middle of a loop.
+SPECIAL_LINE_STARTS = frozenset(';_#lLdDsS \t\r\n')
+
+
+class _Loop:
+    def __init__(self, categories: CategorySelection):
+        self._categories = categories
+        self.category = None
+        self.items = []
+        self.reading = False
+        self.skipped = False
+
+        self._columns = []
+        self._lines = []
+        self._row = []
+        self._has_values = False
+
+    def add_item(self, category: str, item: str):
+        self.category = category
+        self.items.append(item)
+
+        self.skipped = category not in self._categories
+
+    def start(self):
+        self.reading = True
+
+        if not self.skipped:
+            selection = self._categories[self.category]
+            self._columns = [(index, item, []) for index, item in enumerate(self.items)
+                             if selection is None or item in selection]
+
+    # Lines without quotes, comments or text fields are split in batches.
+    def add_line(self, line: str):
+        self._lines.append(line)
+
+        if len(self._lines) >= LINE_BATCH_SIZE:
+            self._flush()
+
+    def add(self, values: List[str]):
+        self._flush()
+        self._add_values(values)
+
+    def _flush(self):
+        if len(self._lines) > 0:
+            values = ''.join(self._lines).split()
+            self._lines = []
+
+            self._add_values(values)
+
+    def _add_values(self, values: List[str]):
+        if len(values) == 0:
+            return
+
+        self._has_values = True
+
+        # A row may continue on the next line.
+        if len(self._row) > 0:
+            values = self._row + values
+
+        width = len(self.items)
+        end = len(values) - len(values) % width
+
+        for index, item, column in self._columns:
+            column.extend(values[index: end: width])
+
+        self._row = values[end:]
+
+    def finish(self, block: Dict[str, Dict]):
+        if self.category is None or self.skipped:
+            return
+
+        self._flush()
+
+        if len(self._row) > 0:
+            raise ValueError(f"more items than values in {self.category}")
+
+        category = block.setdefault(self.category, {})
+        if self._has_values:
+            for index, item, column in self._columns:
+                category[item] = column
+
+
+def _open(path: str) -> IO:
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt')
+    else:
+        return open(path, 'rt')
+
+
+def _tokenize(line: str) -> List[str]:
+    quoted = "'" in line or '"' in line
+    if quoted:
+        values = VALUE_PATTERN.findall(line)
+    else:
+        values = line.split()
+
+    # A comment starts at a value with a hash in front, quoted values don't count.
+    if '#' in line:
+        for index, value in enumerate(values):
+            if value.startswith('#'):
+                values = values[:index]
+                break
+
+    if quoted:
+        values = [value[1:-1] if value[0] == value[-1] and value[0] in "'\"" else value for value in values]
+
+    return values
+
+
+# Returns the text between the semicolons and what follows the closing semicolon on its line.
+def _read_text_field(line: str, lines: Iterator[str]) -> Tuple[str, str]:
+    parts = [line[1:]]
+    for line in lines:
+        if line.startswith(';'):
+            return ''.join(parts).strip(), line[1:]
+
+        parts.append(line)
+
+    raise ValueError("unterminated text field")
+
+
+# Yields the data blocks of an mmCIF file, as (heading, block) pairs.
+# The blocks look the same as MMCIF2Dict's: single values are strings and looped values lists.
+# Only the selected categories and items are kept, the rest is skipped without being tokenized.
+def read_mmcif(path: str, categories: CategorySelection) -> Iterator[Tuple[str, Dict[str, Dict]]]:
+
+    with _open(path) as f:
+        lines = iter(f)
+
+        heading = None
+        block = {}
+        loop = None
+
+        for line in lines:
+            # The rows of a loop mostly take the fast path.
+            if loop is not None and loop.reading and line[0] not in SPECIAL_LINE_STARTS and \
+                    "'" not in line and '"' not in line and '#' not in line:
+                if not loop.skipped:
+                    loop.add_line(line)
+                continue
+
+            text = line.lstrip()
+            if len(text) == 0 or text[0] == '#':
+                continue
+
+            if line[0] == ';':
+                if loop is not None and loop.skipped:
+                    _read_text_field(line, lines)
+                    loop.reading = True
+                    continue
+
+                value, rest = _read_text_field(line, lines)
+                values = [value] + _tokenize(rest)
+
+            elif text[0] == '_':
+                parts = text.split(None, 1)
+                category, _, item = parts[0].rpartition('.')
+                rest = parts[1] if len(parts) > 1 else ''
+
+                if loop is not None and not loop.reading:
+                    loop.add_item(category, item)
+
+                    if rest.strip() != '':
+                        loop.start()
+                        if not loop.skipped:
+                            loop.add(_tokenize(rest))
+                    continue
+
+                if loop is not None:
+                    loop.finish(block)
+                    loop = None
+
+                values = _tokenize(rest)
+                if len(values) > 0:
+                    value = values[0] if len(values) == 1 else values
+                else:
+                    # The value is on the next line.
+                    line = next(lines)
+                    if line.startswith(';'):
+                        value, rest = _read_text_field(line, lines)
+                    else:
+                        values = _tokenize(line)
+                        value = values[0] if len(values) == 1 else values
+
+                selection = categories.get(category, [])
+                if category in categories and (selection is None or item in selection):
+                    block.setdefault(category, {})[item] = value
+                continue
+
+            elif text[0] in 'lLdDsS' and text[:5].lower() in ('loop_', 'data_', 'save_'):
+                if loop is not None:
+                    loop.finish(block)
+                    loop = None
+
+                keyword = text[:5].lower()
+                if keyword == 'loop_':
+                    loop = _Loop(categories)
+
+                elif keyword == 'data_':
+                    if len(block) > 0:
+                        yield heading, block
+
+                    heading = text[5:].rstrip('\n')
+                    block = {}
+                else:
+                    # Save frames only occur in dictionaries.
+                    for line in lines:
+                        if line.strip() == 'save_':
+                            break
+                continue
+
+            elif loop is not None and loop.skipped:
+                loop.reading = True
+                continue
+            else:
+                values = _tokenize(line)
+
+            if loop is not None:
+                if not loop.reading:
+                    loop.start()
+
+                loop.add(values)
+
+        if loop is not None:
+            loop.finish(block)
+
+        if len(block) > 0:
+            yield heading, block
@@ -1,10 +1,13 @@
-from typing import IO
+from typing import IO, Dict, List, Optional, Set, Tuple
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from itertools import compress, count, repeat
+from operator import eq
 import logging
 
-from pdbecif.mmcif_tools import MMCIF2Dict
-
-from prs.models.databank import Databank
+from prs.indexers.cif import read_mmcif
+from prs.indexers.quarantine import Quarantine
+from prs.models.databank import Databank, DatabankShard, DatabankGroup
 
 _log = logging.getLogger(__name__)
 
@@ -16,6 +19,27 @@ DB_NAMES = {
 }
 
 
+DEFAULT_CHUNK_SIZE = 100
+
+
+# What index_mmcif reads, the coordinates are left out of the atom sites.
+MMCIF_CATEGORIES = {
+    '_struct_keywords': None,
+    '_entry': None,
+    '_exptl': None,
+    '_refine': None,
+    '_atom_site': ['id', 'group_PDB', 'pdbx_PDB_model_num', 'auth_comp_id', 'label_asym_id', 'auth_atom_id', 'label_alt_id'],
+    '_struct': None,
+    '_entity': None,
+    '_entity_name_com': None,
+    '_entity_poly': None,
+    '_audit_author': None,
+    '_citation': None,
+    '_struct_ref': None,
+    '_pdbx_poly_seq_scheme': ['seq_id', 'asym_id', 'mon_id'],
+}
+
+
 AMINO_ACID_ONE_LETTER_CODES = { 
   'ALA' : 'A',
   'ARG' : 'R',
@@ -42,15 +66,99 @@ AMINO_ACID_ONE_LETTER_CODES = {
 }
 
 
-def index_mmcif(gz_path: str, atom_databank: Databank, seqres_databank: Databank):
+# Returns the model numbers, the sequences of the chains in model 1 and the names of the ligands.
+def scan_atom_sites_reference(atoms: Dict[str, List[str]]) -> Tuple[Set[str], Dict[str, str], Set[str]]:
+
+    model_ids = set([])
+    ligand_names = set([])
+    atom_sequences = {}
+
+    for atom_index, atom_id in enumerate(atoms['id']):
+        atom_group = atoms['group_PDB'][atom_index]
+        model_number = atoms['pdbx_PDB_model_num'][atom_index]
+        residue_name = atoms['auth_comp_id'][atom_index]
+        chain_id = atoms['label_asym_id'][atom_index]
+        atom_name = atoms['auth_atom_id'][atom_index]
+        alt_id = atoms['label_alt_id'][atom_index]
+
+        model_ids.add(model_number)
+
+        if atom_group == "ATOM" and model_number == '1' and residue_name != "HOH" and atom_name == 'CA' and alt_id in ['.', 'A']:
+            if chain_id not in atom_sequences:
+                atom_sequences[chain_id] = ""
+
+            atom_sequences[chain_id] += AMINO_ACID_ONE_LETTER_CODES.get(residue_name, 'X')
+
+        elif atom_group == "HETATM" and residue_name != "HOH":
+            ligand_names.add(residue_name)
+
+    return model_ids, atom_sequences, ligand_names
+
+
+# Gives the same as scan_atom_sites_reference, but works on whole columns instead of looking up every atom.
+# Only the alpha carbons, a small part of the atoms, are checked one by one.
+def scan_atom_sites(atoms: Dict[str, List[str]]) -> Tuple[Set[str], Dict[str, str], Set[str]]:
+
+    atom_groups = atoms['group_PDB']
+    model_numbers = atoms['pdbx_PDB_model_num']
+    residue_names = atoms['auth_comp_id']
+    chain_ids = atoms['label_asym_id']
+    alt_ids = atoms['label_alt_id']
+
+    model_ids = set(model_numbers)
+
+    ligand_names = set(compress(residue_names, map(eq, atom_groups, repeat("HETATM"))))
+    ligand_names.discard("HOH")
+
+    chain_codes = {}
+    for atom_index in compress(count(), map(eq, atoms['auth_atom_id'], repeat('CA'))):
+        if atom_groups[atom_index] == "ATOM" and model_numbers[atom_index] == '1' and \
+                residue_names[atom_index] != "HOH" and alt_ids[atom_index] in ['.', 'A']:
+
+            residue_code = AMINO_ACID_ONE_LETTER_CODES.get(residue_names[atom_index], 'X')
+            chain_codes.setdefault(chain_ids[atom_index], []).append(residue_code)
+
+    atom_sequences = {chain_id: ''.join(codes) for chain_id, codes in chain_codes.items()}
+
+    return model_ids, atom_sequences, ligand_names
+
+
+# Returns the ids of the entries that were indexed, including those of the chains' sequences.
+# With a quarantine, a file that fails to index is put in there instead of its rows in the databanks,
+# and None is returned.
+def index_mmcif(gz_path: str, atom_databank: Databank, seqres_databank: Databank,
+                quarantine: Optional[Quarantine] = None) -> Optional[List[str]]:
+
+    if quarantine is None:
+        return _index_mmcif(gz_path, atom_databank, seqres_databank)
+
+    databanks = DatabankGroup(atom_databank, seqres_databank)
+
+    databanks.begin_record()
+    try:
+        entry_ids = _index_mmcif(gz_path, atom_databank, seqres_databank)
+    except Exception as error:
+        databanks.discard_record()
+        quarantine.add(gz_path, error)
+
+        return None
+
+    databanks.end_record()
+
+    return entry_ids
+
+
+def _index_mmcif(gz_path: str, atom_databank: Databank, seqres_databank: Databank) -> List[str]:
 
-    for pdb_id, mmcif_dict in MMCIF2Dict().parse(gz_path).items():
+    # Only the sequences differ between the two databanks.
+    databanks = DatabankGroup(atom_databank, seqres_databank)
+
+    entry_ids = []
+    for pdb_id, mmcif_dict in read_mmcif(gz_path, MMCIF_CATEGORIES):
 
         pdb_id = pdb_id.lower()
+        entry_ids.append(pdb_id)
 
-        model_ids = set([])
-        ligand_names = set([])
-        atom_sequences = {}
         seqres_sequences = {}
 
         if '_struct_keywords' in mmcif_dict:
@@ -58,89 +166,61 @@ def index_mmcif(gz_path: str, atom_databank: Databank, seqres_databank: Databank
 
                 entry_id = mmcif_dict['_struct_keywords']['entry_id'].lower()
 
-                atom_databank.index_unique_string(pdb_id, 'id', entry_id)
-                seqres_databank.index_unique_string(pdb_id, 'id', entry_id)
+                databanks.index_unique_string(pdb_id, 'id', entry_id)
 
             if 'pdbx_keywords' in mmcif_dict['_struct_keywords']:
 
                 text = mmcif_dict['_struct_keywords']['pdbx_keywords']
 
-                atom_databank.index_text(pdb_id, 'keywords', text)
-                seqres_databank.index_text(pdb_id, 'keywords', text)
+                databanks.index_text(pdb_id, 'keywords', text)
 
             if 'text' in mmcif_dict['_struct_keywords']:
 
                 text = mmcif_dict['_struct_keywords']['text']
 
-                atom_databank.index_text(pdb_id, 'keywords', text)
-                seqres_databank.index_text(pdb_id, 'keywords', text)
+                databanks.index_text(pdb_id, 'keywords', text)
 
         elif '_entry' in mmcif_dict and 'id' in mmcif_dict['_entry']:
 
             entry_id = mmcif_dict['_entry']['id'].lower()
 
-            atom_databank.index_unique_string(pdb_id, 'id', entry_id)
-            seqres_databank.index_unique_string(pdb_id, 'id', entry_id)
+            databanks.index_unique_string(pdb_id, 'id', entry_id)
 
         if '_exptl' in mmcif_dict:
             if type(mmcif_dict['_exptl']['method']) == str:
 
                 method = mmcif_dict['_exptl']['method']
 
-                atom_databank.index_string(pdb_id, 'method', method)
-                seqres_databank.index_string(pdb_id, 'method', method)
+                databanks.index_string(pdb_id, 'method', method)
             else:
                 for method in mmcif_dict['_exptl']['method']:
-                    atom_databank.index_string(pdb_id, 'method', method)
-                    seqres_databank.index_string(pdb_id, 'method', method)
+                    databanks.index_string(pdb_id, 'method', method)
 
         if '_refine' in mmcif_dict:
             if type(mmcif_dict['_refine']['ls_d_res_high']) == str and mmcif_dict['_refine']['ls_d_res_high'] != '.':
 
                 resolution = float(mmcif_dict['_refine']['ls_d_res_high'])
 
-                atom_databank.index_number(pdb_id, 'resolution', resolution)
-                seqres_databank.index_number(pdb_id, 'resolution', resolution)
+                databanks.index_number(pdb_id, 'resolution', resolution)
             else:
                 for s in mmcif_dict['_refine']['ls_d_res_high']:
                     if s != '.':
                         resolution = float(s)
 
-                        atom_databank.index_number(pdb_id, 'resolution', resolution)
-                        seqres_databank.index_number(pdb_id, 'resolution', resolution)
-
-        atoms = mmcif_dict['_atom_site']
-        for atom_index, atom_id in enumerate(atoms['id']):
-            atom_group = atoms['group_PDB'][atom_index]
-            model_number = atoms['pdbx_PDB_model_num'][atom_index]
-            residue_name = atoms['auth_comp_id'][atom_index]
-            chain_id = atoms['label_asym_id'][atom_index]
-            atom_name = atoms['auth_atom_id'][atom_index]
-            alt_id = atoms['label_alt_id'][atom_index]
-
-            model_ids.add(model_number)
-
-            if atom_group == "ATOM" and model_number == '1' and residue_name != "HOH" and atom_name == 'CA' and alt_id in ['.', 'A']:
-                if chain_id not in atom_sequences:
-                    atom_sequences[chain_id] = ""
+                        databanks.index_number(pdb_id, 'resolution', resolution)
 
-                atom_sequences[chain_id] += AMINO_ACID_ONE_LETTER_CODES.get(residue_name, 'X')
-
-            elif atom_group == "HETATM" and residue_name != "HOH":
-                ligand_names.add(residue_name)
+        model_ids, atom_sequences, ligand_names = scan_atom_sites(mmcif_dict['_atom_site'])
 
         if '_struct' in mmcif_dict:
             if 'entry_id' in mmcif_dict['_struct']:
                 entry_id = mmcif_dict['_struct']['entry_id'].lower()
 
-                atom_databank.index_unique_string(pdb_id, 'id', entry_id)
-                seqres_databank.index_unique_string(pdb_id, 'id', entry_id)
+                databanks.index_unique_string(pdb_id, 'id', entry_id)
 
             if 'title' in mmcif_dict['_struct']:
                 title = mmcif_dict['_struct']['title']
 
-                atom_databank.index_text(pdb_id, 'title', title)
-                seqres_databank.index_text(pdb_id, 'title', title)
+                databanks.index_text(pdb_id, 'title', title)
 
         if '_entity' in mmcif_dict:
             for entity_index, entity_id in enumerate(mmcif_dict['_entity']['id']):
@@ -155,61 +235,48 @@ def index_mmcif(gz_path: str, atom_databank: Databank, seqres_databank: Databank
                     continue
 
                 if description != '?':
-                    atom_databank.index_text(pdb_id, 'molecule', description)
-                    seqres_databank.index_text(pdb_id, 'molecule', description)
+                    databanks.index_text(pdb_id, 'molecule', description)
 
                 if fragment != '?':
-                    atom_databank.index_text(pdb_id, 'molecule', fragment)
-                    seqres_databank.index_text(pdb_id, 'molecule', fragment)
+                    databanks.index_text(pdb_id, 'molecule', fragment)
 
                 if details != '?':
-                    atom_databank.index_text(pdb_id, 'molecule', details)
-                    seqres_databank.index_text(pdb_id, 'molecule', details)
+                    databanks.index_text(pdb_id, 'molecule', details)
 
                 if ec != '?':
-                    atom_databank.index_string(pdb_id, 'ec', ec)
-                    seqres_databank.index_string(pdb_id, 'ec', ec)
+                    databanks.index_string(pdb_id, 'ec', ec)
 
                 if mutation != '?':
-                    atom_databank.index_text(pdb_id, 'mutation', mutation)
-                    seqres_databank.index_text(pdb_id, 'mutation', mutation)
+                    databanks.index_text(pdb_id, 'mutation', mutation)
 
         if '_entity_name_com' in mmcif_dict:
             for entity_index, entity_id in enumerate(mmcif_dict['_entity_name_com']['entity_id']):
                 name = mmcif_dict['_entity_name_com']['name']
 
-                atom_databank.index_text(pdb_id, 'molecule', name)
-                seqres_databank.index_text(pdb_id, 'molecule', name)
+                databanks.index_text(pdb_id, 'molecule', name)
 
         if '_entity_poly' in mmcif_dict:
             for entity_index, entity_id in enumerate(mmcif_dict['_entity_poly']['entity_id']):
                 type_ = mmcif_dict['_entity_poly']['type'][entity_index]
 
-                atom_databank.index_text(pdb_id, 'molecule', type_)
-                seqres_databank.index_text(pdb_id, 'molecule', type_)
+                databanks.index_text(pdb_id, 'molecule', type_)
 
         if '_audit_author' in mmcif_dict:
             for author_name in mmcif_dict['_audit_author']['name']:
-                atom_databank.index_string(pdb_id, "author", author_name)
-                seqres_databank.index_string(pdb_id, "author", author_name)
+                databanks.index_string(pdb_id, "author", author_name)
 
         if '_citation' in mmcif_dict:
             if type(mmcif_dict['_citation']['id']) == str:
 
-                for key in mmcif_dict['_citation']:
-                    if len(key) >= 3:
-                        value = mmcif_dict['_citation'][key]
+                values = [mmcif_dict['_citation'][key] for key in mmcif_dict['_citation'] if len(key) >= 3]
 
-                        atom_databank.index_text(pdb_id, "reference", value)
-                        seqres_databank.index_text(pdb_id, "reference", value)
+                databanks.index_texts(pdb_id, "reference", values)
             else:
                 for publication_index, publication_id in enumerate(mmcif_dict['_citation']['id']):
                     if publication_id != '?':
-                        for key in mmcif_dict['_citation']:
-                            value = mmcif_dict['_citation'][key][publication_index]
+                        values = [mmcif_dict['_citation'][key][publication_index] for key in mmcif_dict['_citation']]
 
-                            atom_databank.index_text(pdb_id, "reference", value)
-                            seqres_databank.index_text(pdb_id, "reference", value)
+                        databanks.index_texts(pdb_id, "reference", values)
 
         if '_struct_ref' in mmcif_dict:
             for ref_index, ref_id in enumerate(mmcif_dict['_struct_ref']['id']):
@@ -219,11 +286,9 @@ def index_mmcif(gz_path: str, atom_databank: Databank, seqres_databank: Databank
                 if db_id in DB_NAMES:
                     db_name = DB_NAMES[db_id]
 
-                    atom_databank.index_link(pdb_id, db_name, in_db_id)
-                    seqres_databank.index_link(pdb_id, db_name, in_db_id)
+                    databanks.index_link(pdb_id, db_name, in_db_id)
                 else:
-                    atom_databank.index_string(pdb_id, db_id, in_db_id)
-                    seqres_databank.index_string(pdb_id, db_id, in_db_id)
+                    databanks.index_string(pdb_id, db_id, in_db_id)
 
         if '_pdbx_poly_seq_scheme' in mmcif_dict:
             for res_index, res_id in enumerate(mmcif_dict['_pdbx_poly_seq_scheme']['seq_id']):
@@ -237,8 +302,7 @@ def index_mmcif(gz_path: str, atom_databank: Databank, seqres_databank: Databank
                 seqres_sequences[chain_id] += one_letter_code
 
         for ligand_name in ligand_names:
-            atom_databank.index_string(pdb_id, "ligand", ligand_name)
-            seqres_databank.index_string(pdb_id, "ligand", ligand_name)
+            databanks.index_string(pdb_id, "ligand", ligand_name)
 
         for chain_id, sequence in atom_sequences.items():
             if len(sequence.replace("X", "")) > 0:
@@ -248,6 +312,82 @@ def index_mmcif(gz_path: str, atom_databank: Databank, seqres_databank: Databank
             if len(sequence.replace("X", "")) > 0:
                 seqres_databank.set_sequence(pdb_id + '.' + chain_id, sequence)
 
+        entry_ids.extend(dict.fromkeys([pdb_id + '.' + chain_id for chain_id in list(atom_sequences) + list(seqres_sequences)]))
+
         model_count = len(model_ids)
-        atom_databank.index_number(pdb_id, "model_count", model_count)
-        seqres_databank.index_number(pdb_id, "model_count", model_count)
+        databanks.index_number(pdb_id, "model_count", model_count)
+
+        databanks.count_entry()
+
+    return entry_ids
+
+
+# Indexes the files one by one, with checkpoints along the way.
+# entry_ids holds the ids of the entries that were indexed by path, from the checkpoint that is resumed.
+# Those files are skipped. The checkpoints' state holds entry_ids as it grows.
+def index_mmcif_files(gz_paths: List[str], atom_databank: Databank, seqres_databank: Databank,
+                      quarantine: Optional[Quarantine] = None,
+                      entry_ids: Optional[Dict[str, Optional[List[str]]]] = None) -> Dict[str, Optional[List[str]]]:
+
+    databanks = DatabankGroup(atom_databank, seqres_databank)
+
+    entry_ids = dict(entry_ids or {})
+    for gz_path in gz_paths:
+        if gz_path not in entry_ids:
+            entry_ids[gz_path] = index_mmcif(gz_path, atom_databank, seqres_databank, quarantine)
+
+            databanks.checkpoint({'entry_ids': entry_ids})
+
+    return entry_ids
+
+
+def _index_mmcif_chunk(gz_paths: List[str], atom_shard: DatabankShard, seqres_shard: DatabankShard,
+                       quarantine: Optional[Quarantine]) -> Tuple[DatabankShard, DatabankShard, Dict[str, Optional[List[str]]],
+                                                                  Optional[Quarantine]]:
+
+    entry_ids = {}
+    with atom_shard, seqres_shard:
+        for gz_path in gz_paths:
+            entry_ids[gz_path] = index_mmcif(gz_path, atom_shard, seqres_shard, quarantine)
+
+    return atom_shard, seqres_shard, entry_ids, quarantine
+
+
+# Returns the ids of the entries that were indexed, by path.
+# Resuming and checkpoints work like in index_mmcif_files, with a checkpoint after every chunk.
+def index_mmcif_parallel(gz_paths: List[str], atom_databank: Databank, seqres_databank: Databank,
+                         worker_count: int, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                         quarantine: Optional[Quarantine] = None,
+                         entry_ids: Optional[Dict[str, Optional[List[str]]]] = None) -> Dict[str, Optional[List[str]]]:
+
+    databanks = DatabankGroup(atom_databank, seqres_databank)
+
+    entry_ids = dict(entry_ids or {})
+    gz_paths = [gz_path for gz_path in gz_paths if gz_path not in entry_ids]
+
+    # Resolve the link targets here, so that the workers need not query them.
+    atom_databank.resolve_databank_ids(list(DB_NAMES.values()))
+    seqres_databank.resolve_databank_ids(list(DB_NAMES.values()))
+
+    with ProcessPoolExecutor(worker_count) as executor:
+        futures = []
+        for chunk_start in range(0, len(gz_paths), chunk_size):
+            chunk = gz_paths[chunk_start: chunk_start + chunk_size]
+            futures.append(executor.submit(_index_mmcif_chunk, chunk,
+                                           atom_databank.create_shard(), seqres_databank.create_shard(),
+                                           Quarantine(quarantine.directory_path) if quarantine is not None else None))
+
+        # Merging in submission order gives the same spools as a serial run.
+        for future in futures:
+            atom_shard, seqres_shard, chunk_entry_ids, chunk_quarantine = future.result()
+
+            atom_databank.merge_shard(atom_shard)
+            seqres_databank.merge_shard(seqres_shard)
+
+            entry_ids.update(chunk_entry_ids)
+            if quarantine is not None:
+                quarantine.merge(chunk_quarantine)
+
+            databanks.checkpoint({'entry_ids': entry_ids})
+
+    return entry_ids
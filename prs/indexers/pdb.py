@@ -2,7 +2,7 @@ from typing import IO
 from datetime import datetime
 import logging
 
-from prs.models.databank import Databank
+from prs.models.databank import Databank, DatabankGroup
 
 
 _log = logging.getLogger(__name__)
@@ -43,6 +43,9 @@ AMINO_ACID_ONE_LETTER_CODES = {
 
 def index_pdb(pdb_file: IO, pdb_atom_databank: Databank, pdb_seqres_databank: Databank):
 
+    # Only the sequences differ between the two databanks.
+    databanks = DatabankGroup(pdb_atom_databank, pdb_seqres_databank)
+
     pdb_id = None
     atom_sequences = {}
     seqres_sequences = {}
@@ -59,13 +62,11 @@ def index_pdb(pdb_file: IO, pdb_atom_databank: Databank, pdb_seqres_databank: Da
 
             pdb_id = line[62: 66]
 
-            pdb_atom_databank.index_unique_string(pdb_id, 'id', pdb_id)
-            pdb_seqres_databank.index_unique_string(pdb_id, 'id', pdb_id)
+            databanks.index_unique_string(pdb_id, 'id', pdb_id)
 
         elif line_type == "TITLE":
 
-            pdb_atom_databank.index_text(pdb_id, 'title', line_data)
-            pdb_seqres_databank.index_text(pdb_id, 'title', line_data)
+            databanks.index_text(pdb_id, 'title', line_data)
 
         elif line_type == "MODEL":
 
@@ -84,12 +85,10 @@ def index_pdb(pdb_file: IO, pdb_atom_databank: Databank, pdb_seqres_databank: Da
                 value = value.strip().rstrip(';')
 
                 if key == "MOLECULE":
-                    pdb_atom_databank.index_string(pdb_id, 'molecule', value.lower())
-                    pdb_seqres_databank.index_string(pdb_id, 'molecule', value.lower())
+                    databanks.index_string(pdb_id, 'molecule', value.lower())
 
                 elif key == "EC":
-                    pdb_atom_databank.index_string(pdb_id, 'ec', value)
-                    pdb_seqres_databank.index_string(pdb_id, 'ec', value)
+                    databanks.index_string(pdb_id, 'ec', value)
 
         elif line_type == "SOURCE":
 
@@ -97,21 +96,18 @@ def index_pdb(pdb_file: IO, pdb_atom_databank: Databank, pdb_seqres_databank: Da
 
         elif line_type == "KEYWDS":
 
-            pdb_atom_databank.index_string(pdb_id, 'keyword', line_data)
-            pdb_seqres_databank.index_string(pdb_id, 'keyword', line_data)
+            databanks.index_string(pdb_id, 'keyword', line_data)
 
         elif line_type == "EXPDTA":
 
-            pdb_atom_databank.index_unique_string(pdb_id, 'method', line_data)
-            pdb_seqres_databank.index_unique_string(pdb_id, 'method', line_data)
+            databanks.index_unique_string(pdb_id, 'method', line_data)
 
         elif line_type == "AUTHOR":
 
             for name in line_data[4:].split(','):
                 name = name.strip()
                 if len(name) > 0:
-                    pdb_atom_databank.index_string(pdb_id, 'author', name)
-                    pdb_seqres_databank.index_string(pdb_id, 'author', name)
+                    databanks.index_string(pdb_id, 'author', name)
 
         elif line_type == "REVDAT":
 
@@ -124,8 +120,7 @@ def index_pdb(pdb_file: IO, pdb_atom_databank: Databank, pdb_seqres_databank: Da
 
                 date = datetime.strptime(date_s, "%d-%m-%y")
 
-                pdb_atom_databank.index_date(pdb_id, 'revision', date)
-                pdb_seqres_databank.index_date(pdb_id, 'revision', date)
+                databanks.index_date(pdb_id, 'revision', date)
 
         elif line_type == "JRNL":
 
@@ -145,11 +140,9 @@ def index_pdb(pdb_file: IO, pdb_atom_databank: Databank, pdb_seqres_databank: Da
                 in_db_id = ids[6]
                 chain_id = ids[1]
 
-                pdb_atom_databank.index_link(pdb_id + '.' + chain_id, db_name, in_db_id)
-                pdb_seqres_databank.index_link(pdb_id + '.' + chain_id, db_name, in_db_id)
+                databanks.index_link(pdb_id + '.' + chain_id, db_name, in_db_id)
             else:
-                pdb_atom_databank.index_string(pdb_id + '.' + chain_id, db_id, in_db_id)
-                pdb_seqres_databank.index_string(pdb_id + '.' + chain_id, db_id, in_db_id)
+                databanks.index_string(pdb_id + '.' + chain_id, db_id, in_db_id)
 
         elif line_type == "HETATM" or line_type == "ATOM":
 
@@ -188,20 +181,16 @@ def index_pdb(pdb_file: IO, pdb_atom_databank: Databank, pdb_seqres_databank: Da
                 seqres_sequences[chain_id] += AMINO_ACID_ONE_LETTER_CODES.get(residue_name, 'X')
 
     for ligand_name in ligand_names:
-        pdb_atom_databank.index_string(pdb_id, "ligand", ligand_name)
-        pdb_seqres_databank.index_string(pdb_id, "ligand", ligand_name)
+        databanks.index_string(pdb_id, "ligand", ligand_name)
 
     if len(source_text) > 0:
-        pdb_atom_databank.index_text(pdb_id, "source", source_text)
-        pdb_seqres_databank.index_text(pdb_id, "source", source_text)
+        databanks.index_text(pdb_id, "source", source_text)
 
     if len(remark_text) > 0:
-        pdb_atom_databank.index_text(pdb_id, "remark", remark_text)
-        pdb_seqres_databank.index_text(pdb_id, "remark", remark_text)
+        databanks.index_text(pdb_id, "remark", remark_text)
 
     if len(ref_text) > 0:
-        pdb_atom_databank.index_text(pdb_id, "reference", ref_text)
-        pdb_seqres_databank.index_text(pdb_id, "reference", ref_text)
+        databanks.index_text(pdb_id, "reference", ref_text)
 
     if pdb_id is not None:
         for chain_id, sequence in atom_sequences.items():
@@ -212,5 +201,7 @@ def index_pdb(pdb_file: IO, pdb_atom_databank: Databank, pdb_seqres_databank: Da
             if len(sequence) > 0:
                 pdb_seqres_databank.set_sequence(pdb_id + '.' + chain_id, sequence)
 
-    pdb_atom_databank.index_number(pdb_id, "model_count", model_count)
-    pdb_seqres_databank.index_number(pdb_id, "model_count", model_count)
+    databanks.index_number(pdb_id, "model_count", model_count)
+
+    if pdb_id is not None:
+        databanks.count_entry()
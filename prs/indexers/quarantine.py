@@ -0,0 +1,44 @@
+from typing import Dict
+import os
+import logging
+
+
+_log = logging.getLogger(__name__)
+
+
+# Takes the records that fail to index out of the build, so that one bad record does not abort it.
+# They are written to a directory, with the error that they raised, and counted by error type.
+class Quarantine:
+    def __init__(self, directory_path: str):
+        self.directory_path = directory_path
+        self.counts: Dict[str, int] = {}
+
+    # A record is the text of an entry, or the path of the file that it came from.
+    def add(self, record: str, error: Exception):
+
+        os.makedirs(self.directory_path, exist_ok=True)
+
+        # Every process gets a file of its own, so that worker processes don't write through each other.
+        path = os.path.join(self.directory_path, f"quarantine-{os.getpid()}.txt")
+        with open(path, 'at') as f:
+            f.write(f"# {type(error).__name__}: {error}\n{record.rstrip()}\n\n")
+
+        error_type = type(error).__name__
+        self.counts[error_type] = self.counts.get(error_type, 0) + 1
+
+        _log.warning(f"quarantined a record after {error_type}: {error}")
+
+    # Adds the counts of a quarantine that was used in a worker process.
+    def merge(self, quarantine: 'Quarantine'):
+        for error_type, count in quarantine.counts.items():
+            self.counts[error_type] = self.counts.get(error_type, 0) + count
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts.values())
+
+    def log_counts(self):
+        for error_type, count in sorted(self.counts.items()):
+            _log.warning(f"quarantined {count} records after {error_type}")
+
+        _log.info(f"quarantined {self.count} records in {self.directory_path}")
@@ -1,9 +1,12 @@
-from typing import IO
+from typing import IO, Iterable, Iterator, List, Optional, Tuple
+import os
 import re
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 import logging
 
-from prs.models.databank import Databank
+from prs.models.databank import Databank, DatabankShard
+from prs.indexers.quarantine import Quarantine
 
 
 _log = logging.getLogger(__name__)
@@ -11,6 +14,8 @@ _log = logging.getLogger(__name__)
 
 EC_PATTERN = re.compile(r'EC\=([0-9\-]+\.[0-9\-]+\.[0-9\-]+\.[0-9\-]+)')
 
+DEFAULT_RANGE_SIZE = 256 * 1024 * 1024
+
 
 def _index_description(description: str, databank: Databank, entry_id: int):
 
@@ -54,14 +59,47 @@ def _index_comment(text: str, databank: Databank, entry_id: int):
     databank.index_text(entry_id, 'cc', text)
 
 
-def index_uniprot(file_: IO, databank: Databank):
+# Yields the lines of every record, up to and including its end of record line.
+def _read_records(file_: Iterable[str]) -> Iterator[List[str]]:
+
+    record = []
+    for line in file_:
+        record.append(line)
+
+        if line.startswith('//'):
+            yield record
+            record = []
+
+    if len(record) > 0:
+        yield record
+
+
+# With a quarantine, a record that fails to index is put in there instead of its rows in the databank.
+def index_uniprot(file_: Iterable[str], databank: Databank, quarantine: Optional[Quarantine] = None):
+
+    for record in _read_records(file_):
+        if quarantine is None:
+            _index_uniprot_record(record, databank)
+            continue
+
+        databank.begin_record()
+        try:
+            _index_uniprot_record(record, databank)
+        except Exception as error:
+            databank.discard_record()
+            quarantine.add(''.join(record), error)
+        else:
+            databank.end_record()
+
+
+def _index_uniprot_record(lines: List[str], databank: Databank):
 
     entry_id = None
     description = ""
     comment = ""
     sequence = ""
     gene_names = ""
-    for line in file_:
+    for line in lines:
 
         data_type = line[:5].strip()
         data = line[5:].rstrip('\n')
@@ -139,6 +177,8 @@ def index_uniprot(file_: IO, databank: Databank):
             sequence += data.replace(' ', '').strip()
 
         elif data_type == '//':
+            databank.count_entry()
+
             if len(description) > 0:
                 _index_description(description, databank, entry_id)
 
@@ -156,3 +196,91 @@ def index_uniprot(file_: IO, databank: Databank):
 
         elif data_type != 'XX':
             databank.index_text(entry_id, data_type.lower(), data)
+
+
+# Splits the file from start on into ranges of whole records.
+def _find_record_ranges(path: str, range_count: int, start: int = 0) -> List[Tuple[int, int]]:
+
+    size = os.path.getsize(path)
+
+    boundaries = [start]
+    with open(path, 'rb') as f:
+        for range_index in range(1, range_count):
+            offset = max(start + (size - start) * range_index // range_count, boundaries[-1])
+            if offset >= size:
+                break
+
+            # Move to the start of the next line, then on past the next end of record.
+            f.seek(offset - 1)
+            f.readline()
+
+            for line in f:
+                if line.startswith(b'//'):
+                    break
+
+            boundaries.append(f.tell())
+
+    boundaries.append(size)
+
+    return [(start, end) for start, end in zip(boundaries[:-1], boundaries[1:]) if end > start]
+
+
+def _read_lines(file_: IO, end: int) -> Iterator[str]:
+
+    position = file_.tell()
+    for line in file_:
+        if position >= end:
+            break
+
+        position += len(line)
+
+        yield line.decode('utf-8')
+
+
+def _index_uniprot_range(path: str, start: int, end: int, shard: DatabankShard,
+                         quarantine: Optional[Quarantine]) -> Tuple[DatabankShard, Optional[Quarantine]]:
+
+    with shard, open(path, 'rb') as f:
+        f.seek(start)
+
+        index_uniprot(_read_lines(f, end), shard, quarantine)
+
+    return shard, quarantine
+
+
+# Indexes the file from the offset start on, with a checkpoint after every range of records.
+# The checkpoints' state holds the path and the offset to resume from.
+def index_uniprot_file(path: str, databank: Databank, start: int = 0, range_size: int = DEFAULT_RANGE_SIZE,
+                       quarantine: Optional[Quarantine] = None):
+
+    range_count = max(1, (os.path.getsize(path) - start) // range_size)
+
+    with open(path, 'rb') as f:
+        for range_start, end in _find_record_ranges(path, range_count, start):
+            f.seek(range_start)
+
+            index_uniprot(_read_lines(f, end), databank, quarantine)
+
+            databank.checkpoint({'path': path, 'offset': end})
+
+
+def index_uniprot_parallel(path: str, databank: Databank, worker_count: int, range_size: int = DEFAULT_RANGE_SIZE,
+                           start: int = 0, quarantine: Optional[Quarantine] = None):
+
+    range_count = max(worker_count, (os.path.getsize(path) - start) // range_size)
+
+    with ProcessPoolExecutor(worker_count) as executor:
+        ranges = _find_record_ranges(path, range_count, start)
+        futures = [executor.submit(_index_uniprot_range, path, range_start, end, databank.create_shard(),
+                                   Quarantine(quarantine.directory_path) if quarantine is not None else None)
+                   for range_start, end in ranges]
+
+        # Merging in file order gives the same spools as a serial run.
+        for (range_start, end), future in zip(ranges, futures):
+            shard, shard_quarantine = future.result()
+
+            databank.merge_shard(shard)
+            if quarantine is not None:
+                quarantine.merge(shard_quarantine)
+
+            databank.checkpoint({'path': path, 'offset': end})
@@ -1,13 +1,32 @@
 import tempfile
 import shutil
 import os
+import re
+import json
+import hashlib
+import logging
+import resource
+from time import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date as Date
-from typing import List
+from typing import List, Dict, Optional, Set, Tuple
+
+from psycopg2.extras import execute_values
 
 from prs.storage import storage
+from prs.models.spool import FileSpool, MemorySpool, NullSpool, QueueSpool
+from prs.models.manifest import FileRecord
+from prs.models.lookup import LookupTable
+from prs.models.kmers import get_kmers, check_kmer_length
+from prs.models.sequence_store import SequenceStore, SequenceStoreWriter, get_sequence_store_path
+
+
+_log = logging.getLogger(__name__)
 
 
 DATABANKS_TABLE = "databanks"
+DATABANK_FILES_TABLE = "databank_files"
 ENTRIES_SEQUENCES_TABLE = "entries_sequences"
 UNIQUE_STRINGS_ENTRIES_TABLE = "unique_strings_entries"
 STRINGS_ENTRIES_TABLE = "strings_entries"
@@ -15,228 +34,1420 @@ NUMBERS_ENTRIES_TABLE = "numbers_entries"
 DATES_ENTRIES_TABLE = "dates_entries"
 WORDS_ENTRIES_TABLE = "words_entries"
 LINKS_TABLE = "links"
+ENTRIES_TABLE = "entries"
+KMERS_ENTRIES_TABLE = "kmers_entries"
+SEQUENCES_TABLE = "sequences"
+KEYS_TABLE = "keys"
+WORDS_TABLE = "words"
+
+# not a table: the sequences as they go into the sequence store, for builds that deduplicate their sequences
+SEQUENCE_STORE_SPOOL = "sequence_store"
+
+SPOOL_FILENAMES = {
+    ENTRIES_SEQUENCES_TABLE: 'entry-sequences.tsv',
+    WORDS_ENTRIES_TABLE: 'words-table.tsv',
+    STRINGS_ENTRIES_TABLE: 'string-table.tsv',
+    UNIQUE_STRINGS_ENTRIES_TABLE: 'unique-string-table.tsv',
+    NUMBERS_ENTRIES_TABLE: 'number-table.tsv',
+    DATES_ENTRIES_TABLE: 'date-table.tsv',
+    LINKS_TABLE: 'links-table.tsv',
+    ENTRIES_TABLE: 'entries-table.tsv',
+    KMERS_ENTRIES_TABLE: 'kmers-table.tsv',
+    SEQUENCES_TABLE: 'sequences-table.tsv',
+    SEQUENCE_STORE_SPOOL: 'sequence-store.tsv',
+}
+
+TABLE_COLUMNS = {
+    ENTRIES_SEQUENCES_TABLE: ('databank_id', 'entry_id', 'sequence'),
+    WORDS_ENTRIES_TABLE: ('databank_id', 'entry_id', 'key', 'word'),
+    STRINGS_ENTRIES_TABLE: ('databank_id', 'entry_id', 'key', 'string'),
+    UNIQUE_STRINGS_ENTRIES_TABLE: ('databank_id', 'entry_id', 'key', 'string'),
+    NUMBERS_ENTRIES_TABLE: ('databank_id', 'entry_id', 'key', 'number'),
+    DATES_ENTRIES_TABLE: ('databank_id', 'entry_id', 'key', 'date'),
+    LINKS_TABLE: ('databank1_id', 'entry1_id', 'databank2_id', 'entry2_id'),
+}
+
+# In the compact schema, the entries tables hold numbers instead of entry ids, keys and words.
+# The entry ids of every build are numbered in a table of its own, the keys and words in lookup tables.
+# The links keep their entry ids, since they point to the entries of other databanks.
+COMPACT_TABLE_COLUMNS = dict(TABLE_COLUMNS, **{ENTRIES_TABLE: ('databank_id', 'id', 'entry_id')})
+
+# the k-mers of the sequences, for the databanks that are built with a k-mer index
+KMERS_COLUMNS = ('databank_id', 'entry_id', 'kmer')
+
+# With deduplicated sequences, the entries refer to their sequence by hash, see get_sequence_hash.
+# Every sequence is stored once, for all builds of all databanks, in a table that is not partitioned.
+DEDUPLICATED_SEQUENCES_COLUMNS = ('databank_id', 'entry_id', 'hash')
+SEQUENCES_COLUMNS = ('hash', 'sequence')
+
+# The spooled sequences of a build that deduplicates them are only those that are new to it. With a sequence
+# directory, all of them are spooled once more, with their entry ids, for writing the sequence store.
+SEQUENCE_STORE_COLUMNS = ('entry_id', 'sequence')
+
+# the tables that builds can have partitions in
+BUILD_TABLES = list(COMPACT_TABLE_COLUMNS) + [KMERS_ENTRIES_TABLE]
+
+# letters and digits, like str.isalpha and str.isdigit
+WORD_PATTERN = re.compile(r'[^\W_]+')
+MIN_WORD_LENGTH = 3
+MAX_WORD_LENGTH = 19
+
+DEFAULT_SPOOL_BUFFER_SIZE = 1024 * 1024
+COPY_BUFFER_SIZE = 1024 * 1024
+DEFAULT_LOAD_WORKERS = 4
+DEFAULT_PIPELINE_QUEUE_SIZE = 64
+PIPELINE_CHUNK_SIZE = 64 * 1024
+DEFAULT_CHECKPOINT_INTERVAL = 600
+DEFAULT_PROGRESS_INTERVAL = 60
+
+CHECKPOINT_FILENAME = 'checkpoint.json'
+
+# the tables whose rows have a key, in the third column
+KEYED_TABLES = {table for table, columns in TABLE_COLUMNS.items() if len(columns) > 2 and columns[2] == 'key'}
+
+# The rows of these tables are spooled once per entry, the indexers often find the same ones more than once.
+# The rows of an entry are remembered until the next entry comes along, or until there are this many.
+DEDUPLICATED_TABLES = KEYED_TABLES | {LINKS_TABLE}
+MAX_ENTRY_ROWS = 10000
+
+# as in pg_indexes, for example: CREATE INDEX words_entries_word_idx ON ONLY public.words_entries USING btree (word)
+INDEX_DEFINITION_PATTERN = re.compile(r'CREATE (UNIQUE )?INDEX \S+ ON (?:ONLY )?\S+ (USING .*)$')
+
+
+def get_sequence_hash(sequence: str) -> str:
+    return hashlib.blake2b(sequence.encode('ascii'), digest_size=16).hexdigest()
+
+
+# Peak resident set sizes in kilobytes, of this process and of the worker processes that ended.
+def get_peak_rss() -> Tuple[int, int]:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
 
 
 class Databank:
-    def __init__(self, name: str):
+
+    # ids of the databanks that are being built in this process, by name
+    _building_ids: Dict[str, int] = {}
+
+    # The numbering of the keys and words of the compact schema, shared by the databanks of this process.
+    # No other process may build databanks at the same time, since it would number them differently.
+    _lookup_tables = {KEYS_TABLE: LookupTable(KEYS_TABLE, 'key'), WORDS_TABLE: LookupTable(WORDS_TABLE, 'word')}
+
+    # With copy_from_stdin, rows are streamed to postgres over the connection instead of
+    # having the server read the spool files, so the server may run on another host.
+    # in_memory keeps the spools in memory instead of in a temporary directory.
+    # With staged, the rows are bulk loaded into unindexed tables, which are indexed afterwards and then
+    # attached as partitions. load_workers tables are loaded at a time, each over its own connection.
+    # pipelined staged builds stream the rows to postgres while they are being indexed, with every
+    # table holding at most pipeline_queue_size chunks of rows that have not been sent yet.
+    # An update changes the published build in place: the rows of the entries from the recorded
+    # and removed files are replaced, see record_file and remove_file.
+    # With a work_directory, the spools are kept in a directory named after the databank in there,
+    # together with a checkpoint saved at most every checkpoint_interval seconds, see checkpoint.
+    # A failed session then leaves them behind, for the next session to resume from.
+    # Progress is logged at most every progress_interval seconds, None turns it off, see count_entry.
+    # key_counts also counts the rows by key. The summary of a session is logged at the end and,
+    # with a metrics_directory, written to a JSON file named after the databank in there.
+    # compact is for databases that were installed with the compact schema, see COMPACT_TABLE_COLUMNS.
+    # With a kmer_length, the k-mers of the sequences are indexed too, for similarity searches.
+    # The length is recorded with the build, an update or a resumed session must use the same one.
+    # With a sequence_directory, the sequences are also stored in a file named after the databank in there,
+    # which is replaced when the build is published, see SequenceStore.
+    # deduplicate_sequences is for databases that were installed with deduplicated sequences,
+    # see DEDUPLICATED_SEQUENCES_COLUMNS. Only the sequences that are new to a session are spooled.
+    def __init__(self, name: str, spool_buffer_size: int = DEFAULT_SPOOL_BUFFER_SIZE,
+                 copy_from_stdin: bool = False, in_memory: bool = False, staged: bool = False,
+                 load_workers: int = DEFAULT_LOAD_WORKERS,
+                 pipelined: bool = False, pipeline_queue_size: int = DEFAULT_PIPELINE_QUEUE_SIZE,
+                 update: bool = False,
+                 work_directory: Optional[str] = None, checkpoint_interval: float = DEFAULT_CHECKPOINT_INTERVAL,
+                 progress_interval: Optional[float] = DEFAULT_PROGRESS_INTERVAL, key_counts: bool = False,
+                 metrics_directory: Optional[str] = None, compact: bool = False,
+                 kmer_length: Optional[int] = None, sequence_directory: Optional[str] = None,
+                 deduplicate_sequences: bool = False):
+
+        if in_memory and not copy_from_stdin:
+            raise ValueError("in memory spools can only be copied from stdin")
+
+        if pipelined and not staged:
+            raise ValueError("only staged builds can be pipelined")
+
+        if update and staged:
+            raise ValueError("updates go into the published tables, they cannot be staged")
+
+        if work_directory is not None and (in_memory or pipelined):
+            raise ValueError("only spool files can be resumed from a work directory")
+
+        if work_directory is not None and compact:
+            raise ValueError("compact builds number their entries, keys and words in memory, they cannot be resumed")
+
+        if sequence_directory is not None and pipelined:
+            raise ValueError("pipelined builds stream their sequences away, they cannot be stored in a file")
+
+        if deduplicate_sequences and pipelined:
+            raise ValueError("pipelined builds stream into their own tables, they cannot share sequences")
+
+        if kmer_length is not None:
+            check_kmer_length(kmer_length)
+
         self._name = name
+        self._spool_buffer_size = spool_buffer_size
+        self._copy_from_stdin = copy_from_stdin or pipelined
+        self._in_memory = in_memory
+        self._staged = staged
+        self._load_workers = load_workers
+        self._pipelined = pipelined
+        self._pipeline_queue_size = pipeline_queue_size
+        self._update = update
+        self._work_directory = work_directory
+        self._checkpoint_interval = checkpoint_interval
+        self._progress_interval = progress_interval
+        self._key_counts = key_counts
+        self._metrics_directory = metrics_directory
+        self._compact = compact
+        self._kmer_length = kmer_length
+        self._sequence_directory = sequence_directory
+
+        self._deduplicate_sequences = deduplicate_sequences
+
+        self._table_columns = dict(COMPACT_TABLE_COLUMNS if compact else TABLE_COLUMNS)
+        if kmer_length is not None:
+            self._table_columns[KMERS_ENTRIES_TABLE] = KMERS_COLUMNS
+
+        # The spooled tables, these are the tables that get partitions, plus the shared sequences
+        # and those for the sequence store.
+        if deduplicate_sequences:
+            self._table_columns[ENTRIES_SEQUENCES_TABLE] = DEDUPLICATED_SEQUENCES_COLUMNS
+            self._spool_columns = dict(self._table_columns, **{SEQUENCES_TABLE: SEQUENCES_COLUMNS})
+
+            if sequence_directory is not None:
+                self._spool_columns[SEQUENCE_STORE_SPOOL] = SEQUENCE_STORE_COLUMNS
+        else:
+            self._spool_columns = self._table_columns
 
     def __enter__(self):
-        self._directory_path = tempfile.mkdtemp(prefix=f"{self._name}_")
-        os.system(f"chmod a+rx {self._directory_path}")
+        checkpoint = None
+
+        if self._pipelined:
+            self._directory_path = None
+            self._spools = {table: QueueSpool(self._pipeline_queue_size, PIPELINE_CHUNK_SIZE)
+                            for table in self._table_columns}
+
+        elif self._in_memory:
+            self._directory_path = None
+            self._spools = {table: MemorySpool() for table in self._spool_columns}
+        else:
+            if self._work_directory is not None:
+                self._directory_path = os.path.join(self._work_directory, self._name)
+                os.makedirs(self._directory_path, exist_ok=True)
+
+                checkpoint = self._read_checkpoint()
+            else:
+                self._directory_path = tempfile.mkdtemp(prefix=f"{self._name}_")
+
+            if not self._copy_from_stdin:
+                os.system(f"chmod a+rx {self._directory_path}")
+
+            self._open_file_spools(checkpoint['spools'] if checkpoint is not None else None)
+
+        if checkpoint is not None:
+            self._id = checkpoint['databank_id']
+
+            _log.info(f"{self._name}: resuming from the checkpoint in {self._directory_path}")
+
+        elif self._update:
+            self._id = Databank._get_published_id(self._name)
+            if self._id is None:
+                raise ValueError(f"{self._name} has no published build to update")
+        else:
+            self._id = self._create_databank(self._name)
+
+        if self._update or checkpoint is not None:
+            build_kmer_length = Databank._get_kmer_length(self._id)
+            if build_kmer_length != self._kmer_length:
+                raise ValueError(f"{self._name} was built with a k-mer length of {build_kmer_length}, not {self._kmer_length}")
+
+        self._files = Databank._load_files(self._id) if self._update else {}
 
-        self._entries_path = os.path.join(self._directory_path, 'entry-ids.tsv')
-        self._sequences_path = os.path.join(self._directory_path, 'entry-sequences.tsv')
-        self._words_path = os.path.join(self._directory_path, 'words-table.tsv')
-        self._strings_path = os.path.join(self._directory_path, 'string-table.tsv')
-        self._unique_strings_path = os.path.join(self._directory_path, 'unique-string-table.tsv')
-        self._numbers_path = os.path.join(self._directory_path, 'number-table.tsv')
-        self._dates_path = os.path.join(self._directory_path, 'date-table.tsv')
-        self._links_path = os.path.join(self._directory_path, 'links-table.tsv')
+        if self._compact:
+            self._load_lookup_tables()
+        self._resume_state = checkpoint['state'] if checkpoint is not None else None
+        self._checkpoint_time = time()
+        self._held_rows = None
+        self._sequence_hashes = set()
+        self._rows_entry_id = None
+        self._entry_rows = set()
 
-        self._id = self._create_databank(self._name)
+        self._start_metrics(checkpoint)
+
+        self._recorded_files = {}
+        self._removed_paths = set()
+        self._databank_ids = {}
+
+        Databank._building_ids[self._name] = self._id
+
+        if self._pipelined:
+            # All tables at once, since every one of them is fed during indexing.
+            self._load_executor = ThreadPoolExecutor(len(self._table_columns))
+            self._loads = [self._load_executor.submit(self._stream_table, table) for table in self._table_columns]
 
         return self
 
     def __exit__(self, exc_type, exc, tb):
 
-        if exc is None:
-            self._store_sequences()
-            self._store_words()
-            self._store_unique_strings()
-            self._store_strings()
-            self._store_numbers()
-            self._store_dates()
-            self._store_links()
+        self._timings['indexing'] = time() - self._start_time
 
-        shutil.rmtree(self._directory_path)
+        if Databank._building_ids.get(self._name) == self._id:
+            del Databank._building_ids[self._name]
 
-        if exc is None:
-            self._remove_old_links()
-            self._remove_old_dates()
-            self._remove_old_numbers()
-            self._remove_old_strings()
-            self._remove_old_unique_strings()
-            self._remove_old_words()
-            self._remove_old_sequences()
-            self._remove_old_databanks()
+        sequence_store_path = None
 
-    def _create_databank(self, name: str) -> int:
-        connection = storage.connect()
-        cursor = connection.cursor()
+        published = False
+        try:
+            if exc is not None:
+                self._abort_spools()
+
+            # Closing the spool of a loader that failed raises its error, the other loaders must not wait for rows then.
+            try:
+                self._close_spools()
+            except:
+                self._abort_spools()
+                raise
+
+            if exc is None:
+                for table, count in self.row_counts.items():
+                    _log.info(f"{self._name}: spooled {count} rows, {self._spools[table].byte_count} bytes for {table}")
+
+                if self._sequence_directory is not None:
+                    with self._timed('sequence_store'):
+                        sequence_store_path = self._write_sequence_store()
+
+                self._publish()
+
+                # Readers of the previous file keep it mapped until they close it.
+                if sequence_store_path is not None:
+                    os.replace(sequence_store_path, get_sequence_store_path(self._sequence_directory, self._name))
+
+                published = True
+
+                if self._compact:
+                    for lookup_table, saved_ids in self._saved_lookup_ids:
+                        lookup_table.forget(saved_ids)
+        finally:
+            if not published and self._pipelined:
+                self._load_executor.shutdown()
+                self._drop_build_tables()
+
+            if not published and sequence_store_path is not None and os.path.exists(sequence_store_path):
+                os.remove(sequence_store_path)
+
+            # A failed session with a checkpoint keeps its build and spools, for the next session to resume.
+            resumable = not published and self._has_checkpoint()
+
+            # A failed build must not be taken for the latest version of the databank.
+            if not published and not self._update and not resumable:
+                self._remove_databank()
+
+            if resumable:
+                _log.info(f"{self._name}: kept {self._directory_path} to resume from its last checkpoint")
+
+            elif self._directory_path is not None:
+                with self._timed('cleanup'):
+                    shutil.rmtree(self._directory_path)
+
+            for phase, seconds in self._timings.items():
+                _log.info(f"{self._name}: {phase} took {seconds:.1f} seconds")
+
+            self._write_summary(published)
+
+    # Writes the sequences of the build next to the published file and returns the path.
+    # An update keeps the sequences of the entries that it does not replace, from the published file if
+    # that belongs to this build, otherwise from postgres.
+    def _write_sequence_store(self) -> str:
+
+        os.makedirs(self._sequence_directory, exist_ok=True)
+
+        path = get_sequence_store_path(self._sequence_directory, self._name)
+        writer = SequenceStoreWriter(f"{path}.{self._id}", self._id)
+        try:
+            if self._update:
+                replaced_entry_ids = set(self._get_replaced_entry_ids())
+
+                if os.path.exists(path) and Databank._get_sequence_store_id(path) == self._id:
+                    with SequenceStore(path) as store:
+                        for entry_id, sequence in store:
+                            if entry_id not in replaced_entry_ids:
+                                writer.add(entry_id, sequence)
+                else:
+                    self._read_published_sequences(writer, replaced_entry_ids)
+
+            if self._deduplicate_sequences:
+                with self._spools[SEQUENCE_STORE_SPOOL].open() as f:
+                    for row in f:
+                        entry_id, sequence = row[:-1].split('\t')
+                        writer.add(entry_id, sequence)
+            else:
+                if self._compact:
+                    entry_ids = {code: entry_id for entry_id, code in self._entry_codes.items()}
+
+                with self._spools[ENTRIES_SEQUENCES_TABLE].open() as f:
+                    for row in f:
+                        databank_id, entry_id, sequence = row[:-1].split('\t')
+                        writer.add(entry_ids[int(entry_id)] if self._compact else entry_id, sequence)
+
+            writer.close()
+        except:
+            writer.abort()
+            raise
+
+        return writer.path
+
+    @staticmethod
+    def _get_sequence_store_id(path: str) -> int:
+        with SequenceStore(path) as store:
+            return store.databank_id
+
+    def _read_published_sequences(self, writer: SequenceStoreWriter, skipped_entry_ids: Set[str]):
+
+        build_table = Databank._get_build_table(ENTRIES_SEQUENCES_TABLE, self._id)
+        if self._deduplicate_sequences:
+            sql = f"select s.entry_id, q.sequence from {build_table} s join {SEQUENCES_TABLE} q on q.hash=s.hash"
+        else:
+            sql = f"select s.entry_id, s.sequence from {build_table} s"
+
+        if self._compact:
+            sql = f"select e.entry_id, s.sequence from ({sql}) s join {ENTRIES_TABLE} e on e.databank_id={self._id} and e.id=s.entry_id"
+        else:
+            sql = f"select rtrim(s.entry_id), s.sequence from ({sql}) s"
+
+        with storage.connection() as connection:
+            # A named cursor fetches the rows in batches, instead of all of them at once.
+            cursor = connection.cursor(name=f"{self._name}_sequences")
+            cursor.execute(sql)
+
+            for entry_id, sequence in cursor:
+                if entry_id not in skipped_entry_ids:
+                    writer.add(entry_id, sequence)
+
+    @staticmethod
+    def _get_build_table(table: str, databank_id: int) -> str:
+        return f"{table}_{databank_id}"
+
+    # Every build gets a partition of its own in each table.
+    def _publish(self):
+
+        if self._staged:
+            self._publish_staged()
+            return
+
+        if self._update:
+            self._publish_update()
+            return
+
+        # One transaction, so readers see either the old or the new build.
+        with storage.connection() as connection:
+            cursor = connection.cursor()
+
+            # Creating the partitions right away would lock the partitioned tables for the readers of
+            # every databank until the transaction ends. Attaching them after the copy does not.
+            for table in self._table_columns:
+                self._create_build_table(cursor, table)
+
+                copy_seconds, index_seconds = self._fill_build_table(cursor, table)
+                self._timings['copy'] = self._timings.get('copy', 0.0) + copy_seconds
+                self._timings['index'] = self._timings.get('index', 0.0) + index_seconds
+
+            self._attach_build_tables(cursor)
+
+            with self._timed('store_sequences'):
+                self._store_sequences(cursor)
+
+            self._save_lookup_tables(cursor)
 
-        cursor.execute(f"insert into {DATABANKS_TABLE} (name) values ('{self._name}')")
-        id_ = None
-        cursor.execute(f"select id from {DATABANKS_TABLE} where name='{self._name}' order by date")
-        id_ = cursor.fetchall()[-1][0]
+            with self._timed('store_files'):
+                self._store_files(cursor)
 
-        connection.commit()
+            with self._timed('remove_old_builds'):
+                self._remove_old_builds(cursor)
 
-        return id_
+    # Replaces the rows of the entries that were indexed again or whose files are gone, in one transaction.
+    # In the compact schema, the entries keep their numbers, see _load_lookup_tables.
+    def _publish_update(self):
 
-    def _remove_old_databanks(self):
+        entry_ids = self._get_replaced_entry_ids()
+        if self._compact:
+            entry_codes = [self._entry_codes[entry_id] for entry_id in entry_ids if entry_id in self._entry_codes]
+
+        with storage.connection() as connection:
+            cursor = connection.cursor()
+
+            with self._timed('delete'):
+                if len(entry_ids) > 0:
+                    for table, columns in self._table_columns.items():
+                        if table == ENTRIES_TABLE:
+                            continue
+
+                        build_table = Databank._get_build_table(table, self._id)
+                        if self._compact and table != LINKS_TABLE:
+                            cursor.execute(f"delete from {build_table} where {columns[1]} = any(%s)", (entry_codes,))
+                        else:
+                            cursor.execute(f"delete from {build_table} where {columns[1]} = any(%s)", (entry_ids,))
+
+            with self._timed('copy'):
+                for table in self._table_columns:
+                    self._copy(cursor, table)
+
+                self._store_sequences(cursor)
+
+            self._save_lookup_tables(cursor)
+
+            with self._timed('store_files'):
+                self._store_files(cursor)
+
+            cursor.execute(f"update {DATABANKS_TABLE} set date=current_timestamp where id=%s", (self._id,))
+
+        _log.info(f"{self._name}: replaced {len(entry_ids)} entries")
+
+    # Every table is loaded into an unindexed table of its own, which is indexed afterwards.
+    # The tables are loaded concurrently, each in a transaction of its own, and are not visible
+    # to readers until the transaction that publishes the build attaches them all as partitions.
+    def _publish_staged(self):
+
+        try:
+            load_start = time()
+
+            if self._pipelined:
+                executor = self._load_executor
+                futures = self._loads
+            else:
+                executor = ThreadPoolExecutor(self._load_workers)
+                futures = [executor.submit(self._load_table, table) for table in self._table_columns]
+
+            with executor:
+                try:
+                    durations = [future.result() for future in futures]
+                except:
+                    for future in futures:
+                        future.cancel()
+                    raise
+
+            self._timings['load'] = time() - load_start
+            self._timings['copy'] = sum(copy_seconds for copy_seconds, index_seconds in durations)
+            self._timings['index'] = sum(index_seconds for copy_seconds, index_seconds in durations)
+
+            with storage.connection() as connection:
+                cursor = connection.cursor()
+
+                self._attach_build_tables(cursor)
+
+                with self._timed('store_sequences'):
+                    self._store_sequences(cursor)
+
+                self._save_lookup_tables(cursor)
+
+                with self._timed('store_files'):
+                    self._store_files(cursor)
+
+                with self._timed('remove_old_builds'):
+                    self._remove_old_builds(cursor)
+        except:
+            self._drop_build_tables()
+            raise
+
+    # Adds the sequences that are not stored yet, by way of a temporary table, since a copy cannot skip rows.
+    def _store_sequences(self, cursor):
+        if not self._deduplicate_sequences:
+            return
+
+        temporary_table = Databank._get_build_table(SEQUENCES_TABLE, self._id)
+
+        cursor.execute(f"create temporary table {temporary_table} (like {SEQUENCES_TABLE}) on commit drop")
+        self._copy(cursor, SEQUENCES_TABLE)
+        cursor.execute(f"insert into {SEQUENCES_TABLE} select * from {temporary_table} on conflict do nothing")
+
+    # Deletes the sequences that no entry refers to anymore, after builds were replaced.
+    # Like the numbering of the compact schema, this assumes that no other process is building databanks.
+    @staticmethod
+    def remove_unused_sequences():
+        with storage.connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute(f"delete from {SEQUENCES_TABLE} s where not exists " +
+                           f"(select 1 from {ENTRIES_SEQUENCES_TABLE} e where e.hash = s.hash)")
+
+            _log.info(f"removed {cursor.rowcount} unused sequences")
+
+    def _load_table(self, table: str) -> Tuple[float, float]:
+        with storage.connection() as connection:
+            cursor = connection.cursor()
+
+            self._create_build_table(cursor, table)
+            return self._fill_build_table(cursor, table)
+
+    # Uses a connection outside of the pool, since it is held for as long as the indexing takes.
+    def _stream_table(self, table: str) -> Tuple[float, float]:
         connection = storage.connect()
-        cursor = connection.cursor()
-        cursor.execute(f"delete from {DATABANKS_TABLE} where id!={self._id} and name='{self._name}'")
-        connection.commit()
+        try:
+            cursor = connection.cursor()
+
+            # Creating the table locks the partitioned table, which must not last until the indexing is done.
+            # Otherwise a databank that is published in the meantime would have to wait for this one.
+            self._create_build_table(cursor, table)
+            connection.commit()
+
+            durations = self._fill_build_table(cursor, table)
+            connection.commit()
+
+            return durations
+        except Exception as error:
+            self._spools[table].fail(error)
+            raise
+        finally:
+            connection.close()
+
+    def _create_build_table(self, cursor, table: str):
+        build_table = Databank._get_build_table(table, self._id)
+        columns = self._table_columns[table]
+
+        # The check constraint spares postgres a scan of the rows when attaching.
+        cursor.execute(f"create table {build_table} (like {table} including defaults, check ({columns[0]} = {self._id}))")
+
+    # Returns the seconds spent copying and indexing.
+    def _fill_build_table(self, cursor, table: str) -> Tuple[float, float]:
+
+        build_table = Databank._get_build_table(table, self._id)
+
+        copy_start = time()
+
+        self._copy(cursor, table)
+
+        index_start = time()
+
+        # The same indexes as the partitioned table, so that attaching can use them.
+        cursor.execute("select indexdef from pg_indexes where tablename=%s", (table,))
+        for (definition,) in cursor.fetchall():
+            match = INDEX_DEFINITION_PATTERN.match(definition)
+            cursor.execute(f"create {match.group(1) or ''}index on {build_table} {match.group(2)}")
+
+        return index_start - copy_start, time() - index_start
+
+    def _attach_build_tables(self, cursor):
+        for table in self._table_columns:
+            build_table = Databank._get_build_table(table, self._id)
+            cursor.execute(f"alter table {table} attach partition {build_table} for values in ({self._id})")
+
+    def _drop_build_tables(self):
+        with storage.connection() as connection:
+            cursor = connection.cursor()
+            for table in self._table_columns:
+                cursor.execute(f"drop table if exists {Databank._get_build_table(table, self._id)}")
+
+    # Dropping the previous build's partitions is a matter of metadata, no rows need to be deleted.
+    def _remove_old_builds(self, cursor):
+
+        cursor.execute(f"select id from {DATABANKS_TABLE} where name=%s and id!=%s", (self._name, self._id))
+        old_ids = [row[0] for row in cursor.fetchall()]
+
+        for table in BUILD_TABLES:
+            for old_id in old_ids:
+                cursor.execute(f"drop table if exists {Databank._get_build_table(table, old_id)}")
+
+        # The links from other databanks to the previous builds go to this one, since the entries that
+        # those databanks keep through updates are not indexed again.
+        cursor.execute(f"update {LINKS_TABLE} set databank2_id=%s where databank2_id = any(%s)", (self._id, old_ids))
+
+        cursor.execute(f"delete from {DATABANKS_TABLE} where id = any(%s)", (old_ids,))
+
+    @staticmethod
+    def _get_published_id(name: str) -> Optional[int]:
+        with storage.connection() as connection:
+            return Databank._select_published_id(connection.cursor(), name)
+
+    # The published build is the one whose tables are attached as partitions.
+    @staticmethod
+    def _select_published_id(cursor, name: str) -> Optional[int]:
+        cursor.execute(f"select d.id from {DATABANKS_TABLE} d join pg_inherits i on i.inhrelid = to_regclass(%s || d.id) " +
+                       "where d.name=%s and i.inhparent = %s::regclass",
+                       (f"{ENTRIES_SEQUENCES_TABLE}_", name, ENTRIES_SEQUENCES_TABLE))
+        row = cursor.fetchone()
+
+        return row[0] if row is not None else None
+
+    @staticmethod
+    def _load_files(databank_id: int) -> Dict[str, FileRecord]:
+        with storage.connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute(f"select path, size, mtime, hash, entry_ids from {DATABANK_FILES_TABLE} where databank_id=%s",
+                           (databank_id,))
+
+            return {path: FileRecord(path, size, mtime, content_hash.strip() if content_hash is not None else None, entry_ids)
+                    for path, size, mtime, content_hash, entry_ids in cursor.fetchall()}
+
+    # The id of the build of a databank that readers see, None if it has none.
+    # With a cursor, this is looked up in the cursor's transaction instead of with a connection of its own.
+    @staticmethod
+    def get_published_id(name: str, cursor=None) -> Optional[int]:
+        if cursor is not None:
+            return Databank._select_published_id(cursor, name)
+
+        return Databank._get_published_id(name)
+
+    # The files that the published build of a databank was indexed from, by path.
+    @staticmethod
+    def load_files(name: str) -> Dict[str, FileRecord]:
+
+        databank_id = Databank._get_published_id(name)
+        if databank_id is None:
+            return {}
+
+        return Databank._load_files(databank_id)
+
+    # The files that the build being updated was indexed from, nothing for new builds.
+    @property
+    def files(self) -> Dict[str, FileRecord]:
+        return dict(self._files)
+
+    # Records a file that was indexed, with the entries that came from it.
+    # When updating, the entries' old rows and the rows of what the file held before are replaced.
+    # A record of an unchanged file, with the same hash, only replaces the size and modification time.
+    def record_file(self, record: FileRecord):
+        self._recorded_files[record.path] = record
+
+    # When updating, the rows of the entries that came from this file are deleted.
+    def remove_file(self, path: str):
+        self._removed_paths.add(path)
+
+    def _get_replaced_entry_ids(self) -> List[str]:
+
+        entry_ids = set()
+        for path in self._removed_paths:
+            if path in self._files:
+                entry_ids.update(self._files[path].entry_ids)
+
+        for path, record in self._recorded_files.items():
+            old_record = self._files.get(path)
+            if old_record is not None and old_record.content_hash is not None and \
+                    old_record.content_hash == record.content_hash:
+                continue
+
+            if old_record is not None:
+                entry_ids.update(old_record.entry_ids)
+
+            entry_ids.update(record.entry_ids)
+
+        return sorted(entry_ids)
+
+    def _store_files(self, cursor):
+
+        paths = sorted(self._removed_paths | set(self._recorded_files))
+        cursor.execute(f"delete from {DATABANK_FILES_TABLE} where databank_id=%s and path = any(%s)", (self._id, paths))
+
+        execute_values(cursor, f"insert into {DATABANK_FILES_TABLE} (databank_id, path, size, mtime, hash, entry_ids) values %s",
+                       [(self._id, record.path, record.size, record.mtime, record.content_hash, record.entry_ids)
+                        for record in self._recorded_files.values()])
+
+    # What the indexer passed to the checkpoint that this session resumed from, None for a new session.
+    @property
+    def resume_state(self) -> Optional[Dict]:
+        return self._resume_state
+
+    @property
+    def checkpoint_due(self) -> bool:
+        return self._work_directory is not None and time() - self._checkpoint_time >= self._checkpoint_interval
+
+    # Saves the spools up to here, together with the indexer's state, which must say where to go on from.
+    # Nothing is saved without a work directory, or when the last checkpoint is too recent, unless forced.
+    def checkpoint(self, state: Dict, force: bool = False):
+
+        if self._work_directory is None or not (force or self.checkpoint_due):
+            return
+
+        spool_states = {}
+        for table, spool in self._spools.items():
+            spool.flush()
+            spool_states[table] = [spool.size, spool.row_count]
+
+        # The spooled links point to these databanks, the checkpoint is of no use once one of them is gone.
+        linked_ids = sorted((set(self._databank_ids.values()) | set(Databank._building_ids.values())) - {self._id})
+
+        checkpoint = {'databank_id': self._id, 'update': self._update, 'options': self._get_spool_options(),
+                      'state': state, 'spools': spool_states,
+                      'linked_ids': linked_ids, 'entries': self._entry_count, 'key_row_counts': self._key_row_counts,
+                      'repeated_rows': self._repeated_row_counts}
+
+        # Replacing the previous checkpoint at once, so that a failure cannot leave half of one behind.
+        path = os.path.join(self._directory_path, CHECKPOINT_FILENAME)
+        with open(path + '.tmp', 'wt') as f:
+            json.dump(checkpoint, f)
+
+        os.replace(path + '.tmp', path)
+
+        self._checkpoint_time = time()
+
+    # The options that decide what is spooled, a session can only resume from a checkpoint with the same ones.
+    # The k-mer length is recorded with the build.
+    def _get_spool_options(self) -> Dict:
+        return {'deduplicate_sequences': self._deduplicate_sequences, 'sequence_directory': self._sequence_directory,
+                'key_counts': self._key_counts}
+
+    def _has_checkpoint(self) -> bool:
+        return self._work_directory is not None and os.path.exists(os.path.join(self._directory_path, CHECKPOINT_FILENAME))
+
+    # Returns the checkpoint in the work directory, if the build it belongs to can still be resumed.
+    def _read_checkpoint(self) -> Optional[Dict]:
+
+        path = os.path.join(self._directory_path, CHECKPOINT_FILENAME)
+        if not os.path.exists(path):
+            return None
+
+        with open(path, 'rt') as f:
+            checkpoint = json.load(f)
+
+        published_id = Databank._get_published_id(self._name)
+        if self._update:
+            resumable = checkpoint['update'] and checkpoint['databank_id'] == published_id
+        else:
+            resumable = not checkpoint['update'] and checkpoint['databank_id'] != published_id and \
+                        Databank._databank_exists(checkpoint['databank_id'])
+
+        resumable = resumable and all(Databank._databank_exists(linked_id) for linked_id in checkpoint['linked_ids'])
+
+        if not resumable:
+            _log.warning(f"{self._name}: not resuming from the checkpoint in {self._directory_path}, " +
+                         "its build or a databank that it links to is gone")
+            os.remove(path)
+
+            return None
+
+        if checkpoint.get('options') != self._get_spool_options():
+            raise ValueError(f"{self._name}: the checkpoint in {self._directory_path} was saved with {checkpoint.get('options')}, " +
+                             "resume with the same options or remove it to start over")
+
+        return checkpoint
+
+    @staticmethod
+    def _databank_exists(databank_id: int) -> bool:
+        with storage.connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute(f"select 1 from {DATABANKS_TABLE} where id=%s", (databank_id,))
+
+            return cursor.fetchone() is not None
+
+    # Holds back the rows of a record until end_record, so that discard_record can drop a bad record as a whole.
+    def begin_record(self):
+        self._held_rows = []
+        self._held_entry_count = 0
+        self._held_entry_ids = []
+        self._held_sequence_hashes = []
+
+    def end_record(self):
+        held_rows, self._held_rows = self._held_rows, None
+
+        for table, row in held_rows:
+            self._spools[table].write(row)
+
+            if self._key_row_counts is not None:
+                self._count_key(table, row)
+
+        for _ in range(self._held_entry_count):
+            self.count_entry()
+
+    def discard_record(self):
+        self._held_rows = None
+
+        # Its rows were never spooled, so they must not count as repeated.
+        self._entry_rows.clear()
+
+        # The numbers of the record's entries were spooled with its rows.
+        for entry_id in self._held_entry_ids:
+            del self._entry_codes[entry_id]
+
+        # and so were its new sequences
+        self._sequence_hashes.difference_update(self._held_sequence_hashes)
+
+    def _start_metrics(self, checkpoint: Optional[Dict]):
+        self._timings = {}
+        self._start_time = time()
+        self._progress_time = self._start_time
+
+        self._entry_count = checkpoint.get('entries', 0) if checkpoint is not None else 0
+        self._start_entry_count = self._entry_count
+
+        self._repeated_row_counts = checkpoint.get('repeated_rows', {}) if checkpoint is not None else {}
+
+        self._key_row_counts = None
+        if self._key_counts:
+            if checkpoint is not None and checkpoint.get('key_row_counts') is not None:
+                self._key_row_counts = checkpoint['key_row_counts']
+            else:
+                self._key_row_counts = {table: {} for table in KEYED_TABLES}
+
+    @contextmanager
+    def _timed(self, phase: str):
+        start = time()
+        try:
+            yield
+        finally:
+            self._timings[phase] = self._timings.get(phase, 0.0) + time() - start
+
+    # The indexers call this for every entry that they are done with, which logs the progress now and then.
+    def count_entry(self):
+        if self._held_rows is not None:
+            self._held_entry_count += 1
+            return
+
+        self._entry_count += 1
+
+        if self._progress_interval is not None and time() - self._progress_time >= self._progress_interval:
+            self._log_progress()
+
+    def _log_progress(self):
+        seconds = time() - self._start_time
+        entry_rate = (self._entry_count - self._start_entry_count) / seconds
+
+        _log.info(f"{self._name}: {self._entry_count} entries, {entry_rate:.0f} entries/s, " +
+                  f"{sum(self.row_counts.values())} rows, {sum(self.byte_counts.values()) / 2 ** 20:.0f} MiB spooled, " +
+                  f"peak RSS {get_peak_rss()[0] / 1024:.0f} MiB")
+
+        self._progress_time = time()
+
+    def _count_key(self, table: str, row: str):
+        if table in KEYED_TABLES:
+            key = row.split('\t', 3)[2]
+
+            counts = self._key_row_counts[table]
+            counts[key] = counts.get(key, 0) + 1
+
+    @property
+    def entry_count(self) -> int:
+        return self._entry_count
+
+    @property
+    def timings(self) -> Dict[str, float]:
+        return dict(self._timings)
+
+    @property
+    def row_counts(self) -> Dict[str, int]:
+        return {table: spool.row_count for table, spool in self._spools.items()}
+
+    @property
+    def byte_counts(self) -> Dict[str, int]:
+        return {table: spool.byte_count for table, spool in self._spools.items()}
+
+    # The rows by key, for the tables that have keys, None unless key_counts is on.
+    @property
+    def key_row_counts(self) -> Optional[Dict[str, Dict[str, int]]]:
+        if self._key_row_counts is None or not self._compact:
+            return self._key_row_counts
+
+        keys = self._keys.get_values()
+        return {table: {keys[int(key_id)]: count for key_id, count in counts.items()}
+                for table, counts in self._key_row_counts.items()}
+
+    @property
+    def summary(self) -> Dict:
+        peak_rss, peak_children_rss = get_peak_rss()
+
+        summary = {'databank': self._name, 'id': self._id, 'entries': self._entry_count,
+                   'rows': self.row_counts, 'repeated_rows': self._repeated_row_counts,
+                   'bytes': self.byte_counts, 'timings': self.timings,
+                   'peak_rss_kb': peak_rss, 'peak_children_rss_kb': peak_children_rss}
+
+        if self._key_row_counts is not None:
+            summary['key_rows'] = self.key_row_counts
+
+        return summary
+
+    def _write_summary(self, published: bool):
+        summary = dict(self.summary, published=published)
+
+        _log.info(f"{self._name}: summary {json.dumps(summary)}")
+
+        if self._metrics_directory is not None:
+            os.makedirs(self._metrics_directory, exist_ok=True)
+
+            with open(os.path.join(self._metrics_directory, f"{self._name}.json"), 'wt') as f:
+                json.dump(summary, f, indent=2)
+
+    # spool_states holds the size and row count of every table's spool at a checkpoint, when resuming.
+    def _open_file_spools(self, spool_states: Optional[Dict[str, List[int]]] = None):
+        self._spools = {}
+        for table in self._spool_columns:
+            path = os.path.join(self._directory_path, SPOOL_FILENAMES[table])
+
+            if spool_states is not None:
+                size, row_count = spool_states[table]
+                self._spools[table] = FileSpool(path, self._spool_buffer_size, size, row_count)
+            else:
+                self._spools[table] = FileSpool(path, self._spool_buffer_size)
+
+    def _spool(self, table: str, row: str):
+        if table in DEDUPLICATED_TABLES and self._is_repeated(table, row):
+            self._repeated_row_counts[table] = self._repeated_row_counts.get(table, 0) + 1
+            return
+
+        if self._held_rows is not None:
+            self._held_rows.append((table, row))
+        else:
+            self._spools[table].write(row)
+
+            if self._key_row_counts is not None:
+                self._count_key(table, row)
+
+    def _is_repeated(self, table: str, row: str) -> bool:
+
+        # the entry id is in the second column
+        start = row.index('\t') + 1
+        entry_id = row[start:row.index('\t', start)]
+
+        if entry_id != self._rows_entry_id or len(self._entry_rows) >= MAX_ENTRY_ROWS:
+            self._rows_entry_id = entry_id
+            self._entry_rows.clear()
+
+        if (table, row) in self._entry_rows:
+            return True
+
+        self._entry_rows.add((table, row))
+        return False
+
+    def create_shard(self) -> 'DatabankShard':
+        databank_ids = dict(self._databank_ids)
+        databank_ids.update(Databank._building_ids)
+
+        return DatabankShard(self._name, self._id, databank_ids, self._spool_buffer_size, self._key_counts,
+                             self._kmer_length, self._deduplicate_sequences, self._sequence_directory)
+
+    # Shards must be merged in the order that a serial run would have spooled their rows.
+    # Shards spool entry ids, keys and words as they are, a compact databank numbers them while merging.
+    def merge_shard(self, shard: 'DatabankShard'):
+        for table, spool in shard._spools.items():
+            if table == SEQUENCES_TABLE:
+                self._merge_sequences(spool)
+            elif self._compact and table not in (LINKS_TABLE, SEQUENCE_STORE_SPOOL):
+                self._merge_compact(table, spool)
+            else:
+                self._spools[table].append(spool)
+
+        self._entry_count += shard._entry_count
+
+        for table, count in shard._repeated_row_counts.items():
+            self._repeated_row_counts[table] = self._repeated_row_counts.get(table, 0) + count
+
+        if self._key_row_counts is not None:
+            for table, counts in shard._key_row_counts.items():
+                for key, count in counts.items():
+                    if self._compact:
+                        key = str(self._keys.get_id(key))
+
+                    self._key_row_counts[table][key] = self._key_row_counts[table].get(key, 0) + count
+
+        shard.remove()
+
+        if self._progress_interval is not None and time() - self._progress_time >= self._progress_interval:
+            self._log_progress()
+
+    # The shard only knows the sequences that it spooled itself.
+    def _merge_sequences(self, spool: FileSpool):
+        target = self._spools[SEQUENCES_TABLE]
+
+        with spool.open() as f:
+            for row in f:
+                sequence_hash = row[:row.index('\t')]
+                if sequence_hash not in self._sequence_hashes:
+                    self._sequence_hashes.add(sequence_hash)
+                    target.write(row)
+
+    def _merge_compact(self, table: str, spool: FileSpool):
+        target = self._spools[table]
+
+        with spool.open() as f:
+            if table in (ENTRIES_SEQUENCES_TABLE, KMERS_ENTRIES_TABLE):
+                for row in f:
+                    databank_id, entry_id, value = row.split('\t', 2)
+                    target.write(f"{databank_id}\t{self._get_entry_code(entry_id)}\t{value}")
+
+            elif table == WORDS_ENTRIES_TABLE:
+                for row in f:
+                    databank_id, entry_id, key, word = row.split('\t', 3)
+                    target.write(f"{databank_id}\t{self._get_entry_code(entry_id)}\t{self._keys.get_id(key)}\t" +
+                                 f"{self._words.get_id(word[:-1])}\n")
+            else:
+                for row in f:
+                    databank_id, entry_id, key, value = row.split('\t', 3)
+                    target.write(f"{databank_id}\t{self._get_entry_code(entry_id)}\t{self._keys.get_id(key)}\t{value}")
+
+    def _load_lookup_tables(self):
+        self._keys = Databank._lookup_tables[KEYS_TABLE]
+        self._words = Databank._lookup_tables[WORDS_TABLE]
+
+        with storage.connection() as connection:
+            cursor = connection.cursor()
+
+            for lookup_table in Databank._lookup_tables.values():
+                if not lookup_table.loaded:
+                    lookup_table.load(cursor)
+
+            # An update keeps the numbers of the entries that are already there.
+            self._entry_codes = {}
+            if self._update:
+                cursor.execute(f"select entry_id, id from {Databank._get_build_table(ENTRIES_TABLE, self._id)}")
+                self._entry_codes = dict(cursor.fetchall())
+
+        self._next_entry_code = max(self._entry_codes.values(), default=0) + 1
+        self._saved_lookup_ids = []
+
+    # Inserts the keys and words that are new, in the transaction that publishes the build.
+    def _save_lookup_tables(self, cursor):
+        if self._compact:
+            self._saved_lookup_ids = [(lookup_table, lookup_table.save(cursor))
+                                      for lookup_table in Databank._lookup_tables.values()]
+
+    # The number of an entry id in the compact schema, entries get numbers in the order they come in.
+    def _get_entry_code(self, entry_id: str) -> int:
+        code = self._entry_codes.get(entry_id)
+        if code is None:
+            code = self._next_entry_code
+            self._next_entry_code += 1
+
+            self._entry_codes[entry_id] = code
+            if self._held_rows is not None:
+                self._held_entry_ids.append(entry_id)
+
+            self._spool(ENTRIES_TABLE, f"{self._id}\t{code}\t{entry_id}\n")
+
+        return code
+
+    def _copy(self, cursor, table: str):
+
+        target_table = Databank._get_build_table(table, self._id)
+        columns = ', '.join(self._spool_columns[table])
+        spool = self._spools[table]
+
+        if self._copy_from_stdin:
+            with spool.open() as f:
+                cursor.copy_expert(f"copy {target_table}({columns}) from stdin delimiter '\t' csv", f, COPY_BUFFER_SIZE)
+        else:
+            cursor.execute(f"copy {target_table}({columns}) from '{spool.path}' delimiter '\t' csv")
+
+    def _close_spools(self):
+        for spool in self._spools.values():
+            spool.close()
+
+    # Makes the loaders of a pipelined build stop, the spools that were closed already are left alone.
+    def _abort_spools(self):
+        if self._pipelined:
+            for spool in self._spools.values():
+                spool.abort()
+
+    def _create_databank(self, name: str) -> int:
+        with storage.connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute(f"insert into {DATABANKS_TABLE} (name, kmer_length) values (%s, %s) returning id",
+                           (name, self._kmer_length))
+            return cursor.fetchone()[0]
+
+    # The length of the k-mers that a build indexed, None if it has no k-mer index.
+    @staticmethod
+    def _get_kmer_length(databank_id: int) -> Optional[int]:
+        with storage.connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute(f"select kmer_length from {DATABANKS_TABLE} where id=%s", (databank_id,))
+
+            return cursor.fetchone()[0]
+
+    def _remove_databank(self):
+        with storage.connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute(f"delete from {DATABANKS_TABLE} where id=%s", (self._id,))
 
     def set_sequence(self, entry_id: str, sequence: str):
 
-        with open(self._sequences_path, 'at') as f:
-            f.write(f"{self._id}\t{entry_id}\t{sequence}\n")
+        if SEQUENCE_STORE_SPOOL in self._spools:
+            self._spool(SEQUENCE_STORE_SPOOL, f"{entry_id}\t{sequence}\n")
 
-    def _store_sequences(self):
-        connection = storage.connect()
-        cursor = connection.cursor()
-        cursor.execute(f"copy {ENTRIES_SEQUENCES_TABLE}(databank_id, entry_id, sequence) from '{self._sequences_path}' delimiter '\t' csv")
-        connection.commit()
+        if self._compact:
+            entry_id = self._get_entry_code(entry_id)
 
-    def _remove_old_sequences(self):
-        connection = storage.connect()
-        cursor = connection.cursor()
-        cursor.execute(f"delete from {ENTRIES_SEQUENCES_TABLE} using {DATABANKS_TABLE} where databank_id!={self._id}"
-                       f" and {DATABANKS_TABLE}.id=databank_id and {DATABANKS_TABLE}.name='{self._name}'")
-        connection.commit()
+        if self._deduplicate_sequences:
+            sequence_hash = get_sequence_hash(sequence)
+            self._spool(ENTRIES_SEQUENCES_TABLE, f"{self._id}\t{entry_id}\t{sequence_hash}\n")
 
-    def index_link(self, entry_id: str, other_database_name: str, other_entry_id: str):
+            if sequence_hash not in self._sequence_hashes:
+                self._sequence_hashes.add(sequence_hash)
+                if self._held_rows is not None:
+                    self._held_sequence_hashes.append(sequence_hash)
 
-        connection = storage.connect()
-        cursor = connection.cursor()
-        cursor.execute(f"select id from {DATABANKS_TABLE} where name='{other_database_name}' order by date")
-        other_database_id = cursor.fetchall()[-1][0]
-        connection.close()
+                self._spool(SEQUENCES_TABLE, f"{sequence_hash}\t{sequence}\n")
+        else:
+            self._spool(ENTRIES_SEQUENCES_TABLE, f"{self._id}\t{entry_id}\t{sequence}\n")
 
-        with open(self._links_path, 'at') as f:
-            f.write(f"{self._id}\t{entry_id}\t{other_database_id}\t{other_entry_id}\n")
+        if self._kmer_length is not None:
+            for kmer in get_kmers(sequence, self._kmer_length):
+                self._spool(KMERS_ENTRIES_TABLE, f"{self._id}\t{entry_id}\t{kmer}\n")
 
-    def _store_links(self, entry_id: str, other_databank_name: str, other_entry_id: str):
-        connection = storage.connect()
-        cursor = connection.cursor()
+    def resolve_databank_ids(self, names: List[str]):
 
-        cursor.execute(f"copy {LINKS_TABLE}(databank1_id, entry1_id, databank2_id, entry2_id) from '{self._links_path}' delimiter '\t' csv")
+        names = [name for name in names
+                 if name not in self._databank_ids and name not in Databank._building_ids]
+        if len(names) == 0:
+            return
 
-        connection.commit()
+        # Links go to the published builds, not to the failed or unfinished builds that are kept for resuming.
+        with storage.connection() as connection:
+            cursor = connection.cursor()
+            for name in names:
+                id_ = Databank._select_published_id(cursor, name)
+                if id_ is not None:
+                    self._databank_ids[name] = id_
 
-    def _remove_old_links(self):
-        connection = storage.connect()
-        cursor = connection.cursor()
-        cursor.execute(f"delete from {LINKS_TABLE} using where databank1_name!={self._name}"
-                       f" and {DATABANKS_TABLE}.id=databank_id and {DATABANKS_TABLE}.name='{self._name}'")
-        cursor.execute(f"delete from {LINKS_TABLE} using {DATABANKS_TABLE} where databank2_id!={self._id}"
-                       f" and {DATABANKS_TABLE}.id=databank_id and {DATABANKS_TABLE}.name='{self._name}'")
-        connection.commit()
+    def _get_databank_id(self, name: str) -> int:
+
+        # A databank that is being rebuilt right now must be linked by its new id.
+        if name in Databank._building_ids:
+            return Databank._building_ids[name]
+
+        if name not in self._databank_ids:
+            self.resolve_databank_ids([name])
+
+            if name not in self._databank_ids:
+                raise ValueError(f"no such databank: {name}")
+
+        return self._databank_ids[name]
+
+    def index_link(self, entry_id: str, other_database_name: str, other_entry_id: str):
+
+        other_database_id = self._get_databank_id(other_database_name)
+
+        self._spool(LINKS_TABLE, f"{self._id}\t{entry_id}\t{other_database_id}\t{other_entry_id}\n")
 
     def index_text(self, entry_id: str, key: str, text: str):
 
-        words = Databank._get_words(text)
+        self.index_words(entry_id, key, Databank._get_words(text))
+
+    def index_texts(self, entry_id: str, key: str, texts: List[str]):
 
-        with open(self._words_path, 'at') as f:
-            for word in words:
-                f.write(f"{self._id}\t{entry_id}\t{key}\t{word}\n")
+        self.index_words(entry_id, key, Databank._get_words('\n'.join(texts)))
+
+    def index_words(self, entry_id: str, key: str, words: List[str]):
+
+        if self._compact:
+            entry_id, key = self._get_entry_code(entry_id), self._keys.get_id(key)
+            words = [self._words.get_id(word) for word in words]
+
+        for word in words:
+            self._spool(WORDS_ENTRIES_TABLE, f"{self._id}\t{entry_id}\t{key}\t{word}\n")
 
     @staticmethod
     def _get_words(text: str) -> List[str]:
-        words = set([])
 
-        i = 0
-        word = ""
-        while i < len(text):
-            if text[i].isalpha() or text[i].isdigit():
-                word += text[i]
+        # a dict keeps the order of the words the same in every process
+        return list(dict.fromkeys([word.lower() for word in WORD_PATTERN.findall(text)
+                                   if MIN_WORD_LENGTH <= len(word) <= MAX_WORD_LENGTH]))
 
-            elif len(word) >= 3 and len(word) < 20:
-                words.add(word.lower())
-                word = ""
+    def index_string(self, entry_id: str, key: str, s: str):
 
-            i += 1
+        if self._compact:
+            entry_id, key = self._get_entry_code(entry_id), self._keys.get_id(key)
 
-        return list(words)
+        s = s.replace('\n', ' ')
 
-    def _store_words(self):
-        connection = storage.connect()
-        cursor = connection.cursor()
-        cursor.execute(f"copy {WORDS_ENTRIES_TABLE}(databank_id, entry_id, key, word) from '{self._words_path}' delimiter '\t' csv")
-        connection.commit()
+        self._spool(STRINGS_ENTRIES_TABLE, f"{self._id}\t{entry_id}\t{key}\t{s}\n")
 
-    def _remove_old_words(self):
-        connection = storage.connect()
-        cursor = connection.cursor()
-        cursor.execute(f"delete from {WORDS_ENTRIES_TABLE} using {DATABANKS_TABLE} where databank_id!={self._id}"
-                       f" and {DATABANKS_TABLE}.id=databank_id and {DATABANKS_TABLE}.name='{self._name}'")
-        connection.commit()
+    def index_unique_string(self, entry_id: str, key: str, s: str):
 
-    def index_string(self, entry_id: str, key: str, s: str):
+        if self._compact:
+            entry_id, key = self._get_entry_code(entry_id), self._keys.get_id(key)
 
         s = s.replace('\n', ' ')
 
-        with open(self._strings_path, 'at') as f:
-            f.write(f"{self._id}\t{entry_id}\t{key}\t{s}\n")
+        self._spool(UNIQUE_STRINGS_ENTRIES_TABLE, f"{self._id}\t{entry_id}\t{key}\t{s}\n")
 
-    def _store_strings(self):
-        connection = storage.connect()
-        cursor = connection.cursor()
-        cursor.execute(f"copy {STRINGS_ENTRIES_TABLE}(databank_id, entry_id, key, string) from '{self._strings_path}' delimiter '\t' csv")
-        connection.commit()
+    def index_number(self, entry_id: str, key: str, number: str):
 
-    def _remove_old_strings(self):
-        connection = storage.connect()
-        cursor = connection.cursor()
-        cursor.execute(f"delete from {STRINGS_ENTRIES_TABLE} using {DATABANKS_TABLE} where databank_id!={self._id}"
-                       f" and {DATABANKS_TABLE}.id=databank_id and {DATABANKS_TABLE}.name='{self._name}'")
-        connection.commit()
+        if self._compact:
+            entry_id, key = self._get_entry_code(entry_id), self._keys.get_id(key)
 
-    def index_unique_string(self, entry_id: str, key: str, s: str):
+        self._spool(NUMBERS_ENTRIES_TABLE, f"{self._id}\t{entry_id}\t{key}\t{number}\n")
 
-        s = s.replace('\n', ' ')
+    def index_date(self, entry_id: str, key: str, date: Date):
 
-        with open(self._unique_strings_path, 'at') as f:
-            f.write(f"{self._id}\t{entry_id}\t{key}\t{s}\n")
+        if self._compact:
+            entry_id, key = self._get_entry_code(entry_id), self._keys.get_id(key)
 
-    def _store_unique_strings(self):
-        connection = storage.connect()
-        cursor = connection.cursor()
-        cursor.execute(f"copy {UNIQUE_STRINGS_ENTRIES_TABLE}(databank_id, entry_id, key, string) from '{self._unique_strings_path}' delimiter '\t' csv")
-        connection.commit()
+        self._spool(DATES_ENTRIES_TABLE, f"{self._id}\t{entry_id}\t{key}\t{date.strftime('%Y-%m-%d')}\n")
 
-    def _remove_old_unique_strings(self):
-        connection = storage.connect()
-        cursor = connection.cursor()
-        cursor.execute(f"delete from {UNIQUE_STRINGS_ENTRIES_TABLE} using {DATABANKS_TABLE} where databank_id!={self._id}"
-                       f" and {DATABANKS_TABLE}.id=databank_id and {DATABANKS_TABLE}.name='{self._name}'")
-        connection.commit()
 
-    def index_number(self, entry_id: str, key: str, number: str):
+# Spools rows for a databank in a worker process, to be merged into that databank afterwards.
+class DatabankShard(Databank):
+    # The shard spools the sequences for the sequence store, but only the databank writes it.
+    def __init__(self, name: str, id_: int, databank_ids: Dict[str, int], spool_buffer_size: int, key_counts: bool = False,
+                 kmer_length: Optional[int] = None, deduplicate_sequences: bool = False,
+                 sequence_directory: Optional[str] = None):
+        # The databank that the shard is merged into logs the progress.
+        super().__init__(name, spool_buffer_size, progress_interval=None, key_counts=key_counts, kmer_length=kmer_length,
+                         sequence_directory=sequence_directory, deduplicate_sequences=deduplicate_sequences)
 
-        with open(self._numbers_path, 'at') as f:
-            f.write(f"{self._id}\t{entry_id}\t{key}\t{number}\n")
+        self._id = id_
+        self._databank_ids = databank_ids
 
-    def _store_numbers(self):
-        connection = storage.connect()
-        cursor = connection.cursor()
-        cursor.execute(f"copy {NUMBERS_ENTRIES_TABLE}(databank_id, entry_id, key, number) from '{self._numbers_path}' delimiter '\t' csv")
-        connection.commit()
+    def __enter__(self):
+        self._directory_path = tempfile.mkdtemp(prefix=f"{self._name}_shard_")
+        self._open_file_spools()
+        self._held_rows = None
+        self._sequence_hashes = set()
+        self._rows_entry_id = None
+        self._entry_rows = set()
+        self._start_metrics(None)
 
-    def _remove_old_numbers(self):
-        connection = storage.connect()
-        cursor = connection.cursor()
-        cursor.execute(f"delete from {NUMBERS_ENTRIES_TABLE} using {DATABANKS_TABLE} where databank_id!={self._id}"
-                       f" and {DATABANKS_TABLE}.id=databank_id and {DATABANKS_TABLE}.name='{self._name}'")
-        connection.commit()
+        return self
 
-    def index_date(self, entry_id: str, key: str, date: Date):
+    def __exit__(self, exc_type, exc, tb):
 
-        with open(self._dates_path, 'at') as f:
-            f.write(f"{self._id}\t{entry_id}\t{key}\t{date.strftime('%Y-%m-%d')}\n")
+        self._close_spools()
 
-    def _store_dates(self):
-        connection = storage.connect()
-        cursor = connection.cursor()
-        cursor.execute(f"copy {DATES_ENTRIES_TABLE}(databank_id, entry_id, key, date) from '{self._dates_path}' delimiter '\t' csv")
-        connection.commit()
+        if exc is not None:
+            self.remove()
 
-    def _remove_old_dates(self):
-        connection = storage.connect()
-        cursor = connection.cursor()
-        cursor.execute(f"delete from {DATES_ENTRIES_TABLE} using {DATABANKS_TABLE} where databank_id!={self._id}"
-                       f" and {DATABANKS_TABLE}.id=databank_id and {DATABANKS_TABLE}.name='{self._name}'")
-        connection.commit()
+    def remove(self):
+        shutil.rmtree(self._directory_path)
+
+
+# Takes the rows of the indexers without storing them, to benchmark the parsers on their own.
+# Nothing is read from postgres either: link targets get made up ids.
+class NullDatabank(Databank):
+    def __init__(self, name: str, spool_buffer_size: int = DEFAULT_SPOOL_BUFFER_SIZE):
+        super().__init__(name, spool_buffer_size)
+
+    def __enter__(self):
+        self._id = 0
+        self._directory_path = None
+        self._spools = {table: NullSpool() for table in TABLE_COLUMNS}
+        self._held_rows = None
+        self._rows_entry_id = None
+        self._entry_rows = set()
+        self._databank_ids = {}
+        self._start_metrics(None)
+
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+
+        self._timings['indexing'] = time() - self._start_time
+
+        self._close_spools()
+
+    def resolve_databank_ids(self, names: List[str]):
+        for name in names:
+            if name not in self._databank_ids:
+                self._databank_ids[name] = -1 - len(self._databank_ids)
+
+
+# Passes the rows from one parse to several databanks, so that the input is parsed only once.
+# A databank can be restricted to the tables it should receive rows for.
+class DatabankGroup:
+    def __init__(self, *databanks: Databank):
+        self._members = []
+        self._table_targets = {table: [] for table in TABLE_COLUMNS}
+
+        for databank in databanks:
+            self.add(databank)
+
+    def add(self, databank: Databank, tables: Optional[Set[str]] = None):
+
+        if tables is None:
+            tables = set(TABLE_COLUMNS)
+
+        self._members.append((databank, tables))
+        for table in tables:
+            self._table_targets[table].append(databank)
+
+    def create_shard(self) -> 'DatabankGroup':
+        group = DatabankGroup()
+        for databank, tables in self._members:
+            group.add(databank.create_shard(), tables)
+
+        return group
+
+    def merge_shard(self, shard: 'DatabankGroup'):
+        for (databank, _), (databank_shard, _) in zip(self._members, shard._members):
+            databank.merge_shard(databank_shard)
+
+    def __enter__(self):
+        for databank, tables in self._members:
+            databank.__enter__()
+
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        for databank, tables in reversed(self._members):
+            databank.__exit__(exc_type, exc, tb)
+
+    def record_file(self, record: FileRecord):
+        for databank, tables in self._members:
+            databank.record_file(record)
+
+    # All members save a checkpoint at once, so that they can be resumed from the same state.
+    def checkpoint(self, state: Dict, force: bool = False):
+        if force or any(databank.checkpoint_due for databank, tables in self._members):
+            for databank, tables in self._members:
+                databank.checkpoint(state, force=True)
+
+    def begin_record(self):
+        for databank, tables in self._members:
+            databank.begin_record()
+
+    def end_record(self):
+        for databank, tables in self._members:
+            databank.end_record()
+
+    def discard_record(self):
+        for databank, tables in self._members:
+            databank.discard_record()
+
+    def count_entry(self):
+        for databank, tables in self._members:
+            databank.count_entry()
+
+    def remove_file(self, path: str):
+        for databank, tables in self._members:
+            databank.remove_file(path)
+
+    def set_sequence(self, entry_id: str, sequence: str):
+        for databank in self._table_targets[ENTRIES_SEQUENCES_TABLE]:
+            databank.set_sequence(entry_id, sequence)
+
+    def index_link(self, entry_id: str, other_database_name: str, other_entry_id: str):
+        for databank in self._table_targets[LINKS_TABLE]:
+            databank.index_link(entry_id, other_database_name, other_entry_id)
+
+    def index_text(self, entry_id: str, key: str, text: str):
+
+        targets = self._table_targets[WORDS_ENTRIES_TABLE]
+        if len(targets) == 0:
+            return
+
+        words = Databank._get_words(text)
+
+        for databank in targets:
+            databank.index_words(entry_id, key, words)
+
+    def index_texts(self, entry_id: str, key: str, texts: List[str]):
+        self.index_text(entry_id, key, '\n'.join(texts))
+
+    def index_words(self, entry_id: str, key: str, words: List[str]):
+        for databank in self._table_targets[WORDS_ENTRIES_TABLE]:
+            databank.index_words(entry_id, key, words)
+
+    def index_string(self, entry_id: str, key: str, s: str):
+        for databank in self._table_targets[STRINGS_ENTRIES_TABLE]:
+            databank.index_string(entry_id, key, s)
+
+    def index_unique_string(self, entry_id: str, key: str, s: str):
+        for databank in self._table_targets[UNIQUE_STRINGS_ENTRIES_TABLE]:
+            databank.index_unique_string(entry_id, key, s)
+
+    def index_number(self, entry_id: str, key: str, number: str):
+        for databank in self._table_targets[NUMBERS_ENTRIES_TABLE]:
+            databank.index_number(entry_id, key, number)
+
+    def index_date(self, entry_id: str, key: str, date: Date):
+        for databank in self._table_targets[DATES_ENTRIES_TABLE]:
+            databank.index_date(entry_id, key, date)
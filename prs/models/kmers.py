@@ -0,0 +1,101 @@
+from typing import List, Dict
+
+
+# The standard amino acids, k-mers with anything else in them are left out.
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+AMINO_ACID_CODES = {amino_acid: code for code, amino_acid in enumerate(AMINO_ACIDS)}
+
+# 20 ** 5 k-mers are rare enough to search with, 20 ** 7 are the most that fit in an integer column.
+DEFAULT_KMER_LENGTH = 5
+MAX_KMER_LENGTH = 7
+
+# identity scores for rescoring candidates, see score_ungapped and score_banded
+MATCH_SCORE = 2
+MISMATCH_SCORE = -1
+GAP_SCORE = -3
+DEFAULT_BAND_WIDTH = 16
+
+
+def check_kmer_length(kmer_length: int):
+    if not 1 <= kmer_length <= MAX_KMER_LENGTH:
+        raise ValueError(f"k-mers must be 1 to {MAX_KMER_LENGTH} residues long, not {kmer_length}")
+
+
+# Returns the distinct k-mers of a sequence as numbers, in the order they occur.
+def get_kmers(sequence: str, kmer_length: int) -> List[int]:
+    return list(get_kmer_positions(sequence, kmer_length))
+
+
+# Returns the first position of every k-mer in the sequence, by k-mer number.
+def get_kmer_positions(sequence: str, kmer_length: int) -> Dict[int, int]:
+
+    positions = {}
+    modulus = len(AMINO_ACIDS) ** kmer_length
+
+    # The number of the k-mer that ends at i rolls along the sequence, restarting after every unknown residue.
+    kmer = 0
+    length = 0
+    for i, amino_acid in enumerate(sequence.upper()):
+        code = AMINO_ACID_CODES.get(amino_acid)
+        if code is None:
+            length = 0
+            kmer = 0
+            continue
+
+        kmer = (kmer * len(AMINO_ACIDS) + code) % modulus
+        length += 1
+
+        if length >= kmer_length and kmer not in positions:
+            positions[kmer] = i - kmer_length + 1
+
+    return positions
+
+
+# Returns the offset of target positions from query positions that most of their shared k-mers are at.
+def get_best_diagonal(query_positions: Dict[int, int], target: str, kmer_length: int) -> int:
+
+    diagonal_counts = {}
+    for kmer, target_position in get_kmer_positions(target, kmer_length).items():
+        query_position = query_positions.get(kmer)
+        if query_position is not None:
+            diagonal = target_position - query_position
+            diagonal_counts[diagonal] = diagonal_counts.get(diagonal, 0) + 1
+
+    return max(diagonal_counts, key=lambda diagonal: (diagonal_counts[diagonal], -abs(diagonal)), default=0)
+
+
+# The best local score without gaps along one diagonal.
+def score_ungapped(query: str, target: str, diagonal: int) -> int:
+
+    best = 0
+    score = 0
+    for i in range(max(0, -diagonal), min(len(query), len(target) - diagonal)):
+        score += MATCH_SCORE if query[i] == target[i + diagonal] else MISMATCH_SCORE
+        if score < 0:
+            score = 0
+
+        best = max(best, score)
+
+    return best
+
+
+# The best local score with gaps, of alignments that stay within band_width of a diagonal.
+def score_banded(query: str, target: str, diagonal: int, band_width: int = DEFAULT_BAND_WIDTH) -> int:
+
+    best = 0
+
+    # scores of the previous query position, by target position, only inside the band
+    previous = {}
+    for i in range(len(query)):
+        current = {}
+        for j in range(max(0, i + diagonal - band_width), min(len(target), i + diagonal + band_width + 1)):
+            score = max(0,
+                        previous.get(j - 1, 0) + (MATCH_SCORE if query[i] == target[j] else MISMATCH_SCORE),
+                        previous.get(j, 0) + GAP_SCORE,
+                        current.get(j - 1, 0) + GAP_SCORE)
+            current[j] = score
+            best = max(best, score)
+
+        previous = current
+
+    return best
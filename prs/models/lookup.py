@@ -0,0 +1,55 @@
+from typing import Dict
+
+from psycopg2.extras import execute_values
+
+
+# Numbers the values of a lookup table of the compact schema, like its keys or words.
+# The table is read once, after that new values get the next ids in memory
+# and are inserted when a databank that uses them is published, see save.
+class LookupTable:
+    def __init__(self, table: str, column: str):
+        self.table = table
+        self.column = column
+
+        self._ids = None
+        self._next_id = 1
+        self._new_ids = {}
+
+    @property
+    def loaded(self) -> bool:
+        return self._ids is not None
+
+    def load(self, cursor):
+        cursor.execute(f"select {self.column}, id from {self.table}")
+        self._ids = dict(cursor.fetchall())
+        self._next_id = max(self._ids.values(), default=0) + 1
+        self._new_ids = {}
+
+    def get_id(self, value: str) -> int:
+        id_ = self._ids.get(value)
+        if id_ is None:
+            id_ = self._next_id
+            self._next_id += 1
+
+            self._ids[value] = id_
+            self._new_ids[value] = id_
+
+        return id_
+
+    # Returns the values by id, for turning ids back into values.
+    def get_values(self) -> Dict[int, str]:
+        return {id_: value for value, id_ in self._ids.items()}
+
+    # Inserts the new values and returns them. Until they are forgotten, see forget,
+    # they are inserted again by the next save, in case this transaction does not go through.
+    def save(self, cursor) -> Dict[str, int]:
+        new_ids = dict(self._new_ids)
+
+        execute_values(cursor, f"insert into {self.table} (id, {self.column}) values %s on conflict do nothing",
+                       [(id_, value) for value, id_ in new_ids.items()])
+
+        return new_ids
+
+    def forget(self, saved_ids: Dict[str, int]):
+        for value in saved_ids:
+            self._new_ids.pop(value, None)
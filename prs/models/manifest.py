@@ -0,0 +1,68 @@
+import os
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+
+HASH_BUFFER_SIZE = 1024 * 1024
+
+
+# A file that a databank was indexed from, with the entries that came out of it.
+# The content hash is None for files that were not hashed, see compare_files.
+class FileRecord:
+    def __init__(self, path: str, size: int, mtime: float, content_hash: Optional[str], entry_ids: Optional[List[str]] = None):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.content_hash = content_hash
+        self.entry_ids = entry_ids or []
+
+    @staticmethod
+    def read(path: str) -> 'FileRecord':
+        stat = os.stat(path)
+
+        return FileRecord(path, stat.st_size, stat.st_mtime, hash_file(path))
+
+
+def hash_file(path: str) -> str:
+    content_hash = hashlib.sha256()
+
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(HASH_BUFFER_SIZE)
+            if len(data) == 0:
+                break
+
+            content_hash.update(data)
+
+    return content_hash.hexdigest()
+
+
+# Returns the records of the files that are new or changed, of the files that were only touched, and the removed paths.
+# Only files whose size or modification time differ from their record are hashed, to find out whether they were
+# only touched. New files are not hashed, so that a build does not read all of its input once more beforehand.
+def compare_files(records: Dict[str, FileRecord], paths: List[str]) -> Tuple[List[FileRecord], List[FileRecord], List[str]]:
+
+    changed = []
+    touched = []
+    for path in paths:
+        stat = os.stat(path)
+
+        old_record = records.get(path)
+        if old_record is not None and old_record.size == stat.st_size and old_record.mtime == stat.st_mtime:
+            continue
+
+        if old_record is None:
+            changed.append(FileRecord(path, stat.st_size, stat.st_mtime, None))
+            continue
+
+        record = FileRecord(path, stat.st_size, stat.st_mtime, hash_file(path))
+
+        if old_record.content_hash == record.content_hash:
+            record.entry_ids = old_record.entry_ids
+            touched.append(record)
+        else:
+            changed.append(record)
+
+    removed = sorted(set(records) - set(paths))
+
+    return changed, touched, removed
@@ -0,0 +1,489 @@
+import re
+import logging
+from datetime import datetime
+from typing import List, Dict, Optional, Tuple, Union
+
+from prs.storage import storage
+from prs.models.databank import (Databank, WORDS_ENTRIES_TABLE, STRINGS_ENTRIES_TABLE, UNIQUE_STRINGS_ENTRIES_TABLE,
+                                 NUMBERS_ENTRIES_TABLE, DATES_ENTRIES_TABLE, LINKS_TABLE, ENTRIES_TABLE, KEYS_TABLE,
+                                 WORDS_TABLE)
+
+
+_log = logging.getLogger(__name__)
+
+
+DEFAULT_PAGE_SIZE = 20
+
+# Totals are counted up to this many entries, beyond that they are only a lower bound.
+MAX_COUNTED_ENTRIES = 10000
+
+# the tables that can be searched by key, with the column that holds the values
+VALUE_COLUMNS = {
+    WORDS_ENTRIES_TABLE: 'word',
+    STRINGS_ENTRIES_TABLE: 'string',
+    UNIQUE_STRINGS_ENTRIES_TABLE: 'string',
+    NUMBERS_ENTRIES_TABLE: 'number',
+    DATES_ENTRIES_TABLE: 'date',
+}
+
+RANGE_OPERATORS = ('<', '<=', '>', '>=')
+
+# For example: title:kinase, resolution<2.0, title:"protein kinase", link:uniprot:P04637, (, ), AND, kinase
+TOKEN_PATTERN = re.compile(r'\s*(?:(\()|(\))|(\w[\w.-]*)\s*(<=|>=|<|>|=|:)\s*("[^"]*"|[^\s()"]+)|("[^"]*"|[^\s()"]+))')
+
+DATE_FORMAT = '%Y-%m-%d'
+
+
+class Term:
+    pass
+
+
+# Entries with a word, string, number or date under a key. Words are found in all keys when key is None.
+class Match(Term):
+    def __init__(self, key: Optional[str], value: str):
+        self.key = key
+        self.value = value
+
+
+# Entries with a number or date under a key that compares to a value, operator is one of RANGE_OPERATORS.
+class Range(Term):
+    def __init__(self, key: str, operator: str, value: str):
+        if operator not in RANGE_OPERATORS:
+            raise ValueError(f"unknown operator {operator}")
+
+        self.key = key
+        self.operator = operator
+        self.value = value
+
+
+# Entries that link to another databank, or to one of its entries. Links in either direction count.
+class Link(Term):
+    def __init__(self, databank_name: str, entry_id: Optional[str] = None):
+        self.databank_name = databank_name
+        self.entry_id = entry_id
+
+
+class And(Term):
+    def __init__(self, *terms: Term):
+        self.terms = list(terms)
+
+
+class Or(Term):
+    def __init__(self, *terms: Term):
+        self.terms = list(terms)
+
+
+# Only valid as part of an AND, there must be something to take the entries from.
+class Not(Term):
+    def __init__(self, term: Term):
+        self.term = term
+
+
+# One query on one of the entries tables, that gives a column of entry ids.
+class _Select(Term):
+    def __init__(self, sql: str, parameters: Tuple):
+        self.sql = sql
+        self.parameters = parameters
+        self.estimate = None
+
+
+# total is exact unless there are more than MAX_COUNTED_ENTRIES entries, then it is at least that many.
+class QueryResult:
+    def __init__(self, entry_ids: List[str], total: int, offset: int, exact: bool = True):
+        self.entry_ids = entry_ids
+        self.total = total
+        self.offset = offset
+        self.exact = exact
+
+
+# Parses queries like: title:kinase AND resolution<2.0 AND ligand:ATP
+# NOT binds tighter than AND, AND tighter than OR, terms without an operator between them are ANDed.
+def parse_query(text: str) -> Term:
+
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = TOKEN_PATTERN.match(text, position)
+        if match is None:
+            raise ValueError(f"cannot parse the query at: {text[position:]}")
+
+        position = match.end()
+        tokens.append(match.groups())
+
+    parser = _Parser(tokens)
+    term = parser.parse_or()
+    if parser.position < len(tokens):
+        raise ValueError(f"unexpected ) in query: {text}")
+
+    return term
+
+
+def _unquote(value: str) -> str:
+    if len(value) >= 2 and value[0] == '"' and value[-1] == '"':
+        return value[1:-1]
+
+    return value
+
+
+class _Parser:
+    def __init__(self, tokens: List[Tuple]):
+        self.tokens = tokens
+        self.position = 0
+
+    def _peek_operator(self) -> Optional[str]:
+        if self.position >= len(self.tokens):
+            return None
+
+        word = self.tokens[self.position][5]
+        if word in ('AND', 'OR', 'NOT'):
+            return word
+
+        return None
+
+    def _at_end(self) -> bool:
+        return self.position >= len(self.tokens) or self.tokens[self.position][1] is not None
+
+    def parse_or(self) -> Term:
+        terms = [self.parse_and()]
+        while self._peek_operator() == 'OR':
+            self.position += 1
+            terms.append(self.parse_and())
+
+        return terms[0] if len(terms) == 1 else Or(*terms)
+
+    def parse_and(self) -> Term:
+        terms = [self.parse_not()]
+        while not self._at_end() and self._peek_operator() != 'OR':
+            if self._peek_operator() == 'AND':
+                self.position += 1
+
+            terms.append(self.parse_not())
+
+        return terms[0] if len(terms) == 1 else And(*terms)
+
+    def parse_not(self) -> Term:
+        if self._peek_operator() == 'NOT':
+            self.position += 1
+            return Not(self.parse_not())
+
+        return self.parse_term()
+
+    def parse_term(self) -> Term:
+        if self._at_end():
+            raise ValueError("the query ends where a term was expected")
+
+        opening, closing, key, operator, value, word = self.tokens[self.position]
+        self.position += 1
+
+        if opening is not None:
+            term = self.parse_or()
+            if self.position >= len(self.tokens) or self.tokens[self.position][1] is None:
+                raise ValueError("missing ) in query")
+
+            self.position += 1
+            return term
+
+        if word is not None:
+            if word in ('AND', 'OR', 'NOT'):
+                raise ValueError(f"{word} must be followed by a term")
+
+            return Match(None, _unquote(word))
+
+        value = _unquote(value)
+        if key == 'link':
+            if operator != ':':
+                raise ValueError("links are searched with link:databank or link:databank:entry")
+
+            databank_name, _, entry_id = value.partition(':')
+            return Link(databank_name, entry_id or None)
+
+        if operator in (':', '='):
+            return Match(key, value)
+
+        return Range(key, operator, value)
+
+
+# Searches the published build of a databank. The query is turned into one select, so that postgres only returns
+# the page of entries that is asked for. An AND takes its entries from its most selective term, as postgres
+# estimates it, and keeps those that the other terms find too, or do not find for NOT. Those are looked up entry
+# by entry, with the indexes on the values and entry ids. As the indexes return the entries of a value in order,
+# the first page of a query whose most selective term is a single value is found without reading all its entries.
+# Other queries, for example ranges and ORs, are read as a whole and sorted, like the total is counted as a whole
+# up to MAX_COUNTED_ENTRIES.
+# Databanks that were built with the compact schema are searched by their numbers, see Databank.
+class Query:
+    def __init__(self, databank_name: str):
+        self.databank_name = databank_name
+
+        self._compact = None
+
+        # the tables that have rows with a key, by databank id and key
+        self._key_tables: Dict[Tuple[int, str], List[str]] = {}
+
+    def search(self, query: Union[str, Term], offset: int = 0, limit: int = DEFAULT_PAGE_SIZE) -> QueryResult:
+
+        if isinstance(query, str):
+            query = parse_query(query)
+
+        with storage.connection() as connection:
+            cursor = connection.cursor()
+
+            databank_id = Databank.get_published_id(self.databank_name, cursor)
+            if databank_id is None:
+                raise ValueError(f"{self.databank_name} has no published build")
+
+            if self._compact is None:
+                cursor.execute("select to_regclass(%s) is not null", (KEYS_TABLE,))
+                self._compact = cursor.fetchone()[0]
+
+            select = self._get_select(cursor, self._compile(cursor, databank_id, query))
+            if select is None:
+                return QueryResult([], 0, offset)
+
+            # A term can find an entry more than once, for example a word under several keys.
+            sql, parameters = select
+            sql = f"select distinct entry_id from ({sql}) s"
+
+            # Entries come in the order of their ids, or of their numbers in the compact schema.
+            cursor.execute(f"{sql} order by entry_id offset %s limit %s", parameters + (offset, limit))
+            rows = cursor.fetchall()
+
+            cursor.execute(f"select count(*) from ({sql} limit %s) c", parameters + (MAX_COUNTED_ENTRIES + 1,))
+            count = cursor.fetchone()[0]
+
+            exact = count <= MAX_COUNTED_ENTRIES
+            total = count if exact else max(MAX_COUNTED_ENTRIES, offset + len(rows))
+
+            if self._compact:
+                page = self._get_entry_ids(cursor, databank_id, [row[0] for row in rows])
+            else:
+                page = [row[0].rstrip() for row in rows]
+
+        return QueryResult(page, total, offset, exact)
+
+    def _get_entry_ids(self, cursor, databank_id: int, codes: List[int]) -> List[str]:
+        cursor.execute(f"select id, entry_id from {ENTRIES_TABLE} where databank_id=%s and id = any(%s)",
+                       (databank_id, codes))
+        entry_ids = dict(cursor.fetchall())
+
+        return [entry_ids[code] for code in codes]
+
+    def _get_id(self, cursor, table: str, column: str, value: str) -> Optional[int]:
+        cursor.execute(f"select id from {table} where {column}=%s", (value,))
+        row = cursor.fetchone()
+
+        return row[0] if row is not None else None
+
+    # Returns the key as it is stored, None when no entry can have it.
+    def _get_stored_key(self, cursor, key: str) -> Optional[Union[str, int]]:
+        if self._compact:
+            return self._get_id(cursor, KEYS_TABLE, 'key', key)
+
+        return key
+
+    def _get_key_tables(self, cursor, databank_id: int, key: str) -> List[str]:
+
+        if (databank_id, key) not in self._key_tables:
+            stored_key = self._get_stored_key(cursor, key)
+
+            tables = []
+            if stored_key is not None:
+                for table in VALUE_COLUMNS:
+                    cursor.execute(f"select exists(select 1 from {table} where databank_id=%s and key=%s)",
+                                   (databank_id, stored_key))
+                    if cursor.fetchone()[0]:
+                        tables.append(table)
+
+            self._key_tables[(databank_id, key)] = tables
+
+        return self._key_tables[(databank_id, key)]
+
+    # Turns the terms into selects on the tables that have their keys.
+    # A term that no entry can match turns into an empty OR.
+    def _compile(self, cursor, databank_id: int, term: Term) -> Term:
+
+        if isinstance(term, And):
+            return And(*[self._compile(cursor, databank_id, t) for t in term.terms])
+
+        if isinstance(term, Or):
+            return Or(*[self._compile(cursor, databank_id, t) for t in term.terms])
+
+        if isinstance(term, Not):
+            return Not(self._compile(cursor, databank_id, term.term))
+
+        if isinstance(term, Link):
+            return self._compile_link(cursor, databank_id, term)
+
+        if isinstance(term, Match) and term.key is None:
+            return self._compile_words(cursor, databank_id, None, term.value)
+
+        tables = self._get_key_tables(cursor, databank_id, term.key)
+        stored_key = self._get_stored_key(cursor, term.key)
+
+        selects = []
+        for table in tables:
+            column = VALUE_COLUMNS[table]
+
+            if isinstance(term, Range):
+                if table not in (NUMBERS_ENTRIES_TABLE, DATES_ENTRIES_TABLE):
+                    continue
+
+                value = self._parse_value(table, term.value)
+                if value is None:
+                    raise ValueError(f"cannot compare the {column}s of {term.key} with {term.value}")
+
+                selects.append(_Select(f"select entry_id from {table} where databank_id=%s and key=%s and {column} {term.operator} %s",
+                                       (databank_id, stored_key, value)))
+
+            elif table == WORDS_ENTRIES_TABLE:
+                selects.append(self._compile_words(cursor, databank_id, stored_key, term.value))
+
+            else:
+                # A value that is not a number or date matches none of them.
+                value = self._parse_value(table, term.value)
+                if value is not None:
+                    selects.append(_Select(f"select entry_id from {table} where databank_id=%s and key=%s and {column}=%s",
+                                           (databank_id, stored_key, value)))
+
+        if isinstance(term, Range) and len(tables) > 0 and len(selects) == 0:
+            raise ValueError(f"{term.key} has no numbers or dates to compare {term.value} with")
+
+        return selects[0] if len(selects) == 1 else Or(*selects)
+
+    # Returns None for numbers and dates that do not parse.
+    @staticmethod
+    def _parse_value(table: str, value: str):
+        try:
+            if table == NUMBERS_ENTRIES_TABLE:
+                return float(value)
+
+            if table == DATES_ENTRIES_TABLE:
+                return datetime.strptime(value, DATE_FORMAT).date()
+        except ValueError:
+            return None
+
+        return value
+
+    # The words of a value are found the way the indexers find them, all of them must match.
+    def _compile_words(self, cursor, databank_id: int, stored_key: Optional[Union[str, int]], value: str) -> Term:
+
+        words = Databank._get_words(value)
+        if len(words) == 0:
+            raise ValueError(f"{value} has no words to search for")
+
+        selects = []
+        for word in words:
+            if self._compact:
+                word = self._get_id(cursor, WORDS_TABLE, 'word', word)
+                if word is None:
+                    return Or()
+
+            if stored_key is None:
+                selects.append(_Select(f"select entry_id from {WORDS_ENTRIES_TABLE} where databank_id=%s and word=%s",
+                                       (databank_id, word)))
+            else:
+                selects.append(_Select(f"select entry_id from {WORDS_ENTRIES_TABLE} where databank_id=%s and key=%s and word=%s",
+                                       (databank_id, stored_key, word)))
+
+        return selects[0] if len(selects) == 1 else And(*selects)
+
+    def _compile_link(self, cursor, databank_id: int, link: Link) -> Term:
+
+        other_id = Databank.get_published_id(link.databank_name, cursor)
+        if other_id is None:
+            return Or()
+
+        outgoing = f"select entry1_id as entry_id from {LINKS_TABLE} where databank1_id=%s and databank2_id=%s"
+        incoming = f"select entry2_id as entry_id from {LINKS_TABLE} where databank2_id=%s and databank1_id=%s"
+        parameters = (databank_id, other_id)
+        if link.entry_id is not None:
+            outgoing += " and entry2_id=%s"
+            incoming += " and entry1_id=%s"
+            parameters += (link.entry_id,)
+
+        sql = f"{outgoing} union all {incoming}"
+
+        # The links keep their entry ids in the compact schema, only the linked entries that are in the databank are found.
+        if self._compact:
+            sql = f"select e.id as entry_id from ({sql}) l join {ENTRIES_TABLE} e on e.databank_id=%s and e.entry_id=l.entry_id::text"
+            return _Select(sql, parameters * 2 + (databank_id,))
+
+        return _Select(sql, parameters * 2)
+
+    def _estimate(self, cursor, term: Term) -> float:
+
+        if isinstance(term, _Select):
+            if term.estimate is None:
+                cursor.execute(f"explain (format json) {term.sql}", term.parameters)
+                term.estimate = cursor.fetchone()[0][0]['Plan']['Plan Rows']
+
+            return term.estimate
+
+        if isinstance(term, And):
+            return min([self._estimate(cursor, t) for t in term.terms if not isinstance(t, Not)], default=0)
+
+        if isinstance(term, Or):
+            return sum(self._estimate(cursor, t) for t in term.terms)
+
+        return 0
+
+    # Returns the sql and parameters of a select of the entries that match the term, None when none can.
+    def _get_select(self, cursor, term: Term) -> Optional[Tuple[str, Tuple]]:
+
+        if isinstance(term, _Select):
+            return term.sql, term.parameters
+
+        if isinstance(term, Or):
+            selects = [self._get_select(cursor, t) for t in term.terms]
+            return Query._combine('union', [select for select in selects if select is not None])
+
+        if isinstance(term, And):
+            included = [t for t in term.terms if not isinstance(t, Not)]
+            excluded = [t.term for t in term.terms if isinstance(t, Not)]
+            if len(included) == 0:
+                raise ValueError("NOT must be ANDed with a term that it takes the entries from")
+
+            if len(included) > 1:
+                included.sort(key=lambda t: self._estimate(cursor, t))
+
+            selects = []
+            for t in included:
+                select = self._get_select(cursor, t)
+                if select is None:
+                    return None
+
+                selects.append(select)
+
+            excluded_selects = [self._get_select(cursor, t) for t in excluded]
+            return Query._filter(selects[0], selects[1:], [select for select in excluded_selects if select is not None])
+
+        raise ValueError("NOT must be ANDed with a term that it takes the entries from")
+
+    # Combines selects with a set operation.
+    @staticmethod
+    def _combine(operation: str, selects: List[Tuple[str, Tuple]]) -> Optional[Tuple[str, Tuple]]:
+
+        if len(selects) <= 1:
+            return selects[0] if len(selects) == 1 else None
+
+        sql = f" {operation} ".join(f"({select_sql})" for select_sql, parameters in selects)
+        return sql, sum((parameters for select_sql, parameters in selects), ())
+
+    # Keeps the entries of a select that the included selects find too and the excluded selects do not.
+    @staticmethod
+    def _filter(select: Tuple[str, Tuple], included: List[Tuple[str, Tuple]],
+                excluded: List[Tuple[str, Tuple]]) -> Tuple[str, Tuple]:
+
+        if len(included) == 0 and len(excluded) == 0:
+            return select
+
+        sql, parameters = select
+
+        conditions = []
+        for i, (other_sql, other_parameters) in enumerate(included + excluded):
+            exists = "exists" if i < len(included) else "not exists"
+            conditions.append(f"{exists} (select 1 from ({other_sql}) f{i} where f{i}.entry_id = d.entry_id)")
+            parameters += other_parameters
+
+        return f"select d.entry_id from ({sql}) d where {' and '.join(conditions)}", parameters
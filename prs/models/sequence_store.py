@@ -0,0 +1,257 @@
+import os
+import mmap
+import heapq
+import shutil
+import struct
+from array import array
+from typing import IO, Iterator, Optional, Tuple, Union
+
+
+SEQUENCE_STORE_EXTENSION = '.seq'
+
+# magic, databank id, number of entries, bytes of residues, bytes of entry ids
+HEADER = struct.Struct('<8sQQQQ')
+MAGIC = b'PRSSEQ1\0'
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# the number of entries that the writer holds in memory
+SORT_RUN_SIZE = 1000000
+
+
+def get_sequence_store_path(directory_path: str, databank_name: str) -> str:
+    return os.path.join(directory_path, f"{databank_name}{SEQUENCE_STORE_EXTENSION}")
+
+
+# Writes the sequences of a databank into one file, laid out as:
+#   the header, see HEADER
+#   the offsets of the sequences in the residues, one more than there are entries
+#   the offsets of the entry ids in the entry ids, one more than there are entries
+#   the positions of the entries, ordered by entry id
+#   the residues of all sequences, one after the other
+#   the entry ids, one after the other
+# The numbers are unsigned 64 bit integers in native byte order, so that a reader can map them as they are.
+# Everything goes to scratch files next to the store until it is closed, at most SORT_RUN_SIZE entries are held
+# in memory. The entry ids are sorted in runs of that many, which are merged when the store is closed.
+class SequenceStoreWriter:
+    def __init__(self, path: str, databank_id: int):
+        self.path = path
+        self.databank_id = databank_id
+
+        self._residues_file = open(f"{path}.residues", 'wb')
+        self._ids_file = open(f"{path}.ids", 'wb')
+        self._offsets_file = open(f"{path}.offsets", 'wb')
+        self._id_offsets_file = open(f"{path}.id-offsets", 'wb')
+
+        self._count = 0
+        self._residues_size = 0
+        self._ids_size = 0
+
+        # the offsets that are not written yet
+        self._offsets = array('Q', [0])
+        self._id_offsets = array('Q', [0])
+
+        # the entry ids with their positions, that are not in a run yet
+        self._run = []
+        self._run_paths = []
+
+    def add(self, entry_id: str, sequence: Union[str, bytes, memoryview]):
+
+        if isinstance(sequence, str):
+            sequence = sequence.encode('ascii')
+
+        encoded_id = entry_id.encode('utf-8')
+
+        self._residues_file.write(sequence)
+        self._ids_file.write(encoded_id)
+
+        self._residues_size += len(sequence)
+        self._ids_size += len(encoded_id)
+
+        self._offsets.append(self._residues_size)
+        self._id_offsets.append(self._ids_size)
+        self._run.append((encoded_id, self._count))
+        self._count += 1
+
+        if len(self._run) >= SORT_RUN_SIZE:
+            self._write_offsets()
+            self._write_run()
+
+    def _write_offsets(self):
+        self._offsets.tofile(self._offsets_file)
+        self._id_offsets.tofile(self._id_offsets_file)
+
+        self._offsets = array('Q')
+        self._id_offsets = array('Q')
+
+    # Runs are lines of an entry id and its position, sorted by entry id.
+    def _write_run(self):
+
+        self._run.sort()
+
+        run_path = f"{self.path}.run{len(self._run_paths)}"
+        self._run_paths.append(run_path)
+
+        with open(run_path, 'wb') as f:
+            for encoded_id, position in self._run:
+                f.write(b"%s\t%d\n" % (encoded_id, position))
+
+        self._run = []
+
+    @staticmethod
+    def _read_run(run_path: str) -> Iterator[Tuple[bytes, int]]:
+        with open(run_path, 'rb') as f:
+            for line in f:
+                encoded_id, position = line.rsplit(b'\t', 1)
+                yield encoded_id, int(position)
+
+    def close(self):
+
+        self._write_offsets()
+        if len(self._run) > 0:
+            self._write_run()
+
+        self._close_scratch_files()
+
+        with open(self.path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, self.databank_id, self._count, self._residues_size, self._ids_size))
+
+            self._copy_scratch_file(f"{self.path}.offsets", f)
+            self._copy_scratch_file(f"{self.path}.id-offsets", f)
+
+            order = array('Q')
+            for encoded_id, position in heapq.merge(*[self._read_run(run_path) for run_path in self._run_paths]):
+                order.append(position)
+
+                if len(order) >= SORT_RUN_SIZE:
+                    order.tofile(f)
+                    order = array('Q')
+
+            order.tofile(f)
+
+            self._copy_scratch_file(f"{self.path}.residues", f)
+            self._copy_scratch_file(f"{self.path}.ids", f)
+
+        for run_path in self._run_paths:
+            os.remove(run_path)
+
+    @staticmethod
+    def _copy_scratch_file(scratch_path: str, f: IO):
+        with open(scratch_path, 'rb') as scratch_file:
+            shutil.copyfileobj(scratch_file, f, COPY_BUFFER_SIZE)
+
+        os.remove(scratch_path)
+
+    def _close_scratch_files(self):
+        for scratch_file in (self._residues_file, self._ids_file, self._offsets_file, self._id_offsets_file):
+            scratch_file.close()
+
+    # Removes everything that was written.
+    def abort(self):
+
+        self._close_scratch_files()
+
+        scratch_paths = [scratch_file.name for scratch_file in
+                         (self._residues_file, self._ids_file, self._offsets_file, self._id_offsets_file)]
+
+        for path in scratch_paths + self._run_paths + [self.path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# Maps a file of SequenceStoreWriter into memory. The sequences come as memoryviews of the residues in the map,
+# so no copies are made until asked for, for example with bytes(). Sequences that are still referenced
+# when the store is closed keep the map open until they are gone.
+class SequenceStore:
+    def __init__(self, path: str):
+        self.path = path
+
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.databank_id, self._count, residues_size, ids_size = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a sequence store")
+
+        view = memoryview(self._mmap)
+
+        start = HEADER.size
+        self._offsets = view[start:start + 8 * (self._count + 1)].cast('Q')
+
+        start += 8 * (self._count + 1)
+        self._id_offsets = view[start:start + 8 * (self._count + 1)].cast('Q')
+
+        start += 8 * (self._count + 1)
+        self._order = view[start:start + 8 * self._count].cast('Q')
+
+        start += 8 * self._count
+        self._residues = view[start:start + residues_size]
+
+        start += residues_size
+        self._ids = view[start:start + ids_size]
+
+        self._views = [view, self._offsets, self._id_offsets, self._order, self._residues, self._ids]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        for view in self._views:
+            view.release()
+
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _get_entry_id(self, position: int) -> bytes:
+        return self._ids[self._id_offsets[position]:self._id_offsets[position + 1]].tobytes()
+
+    def _get_sequence(self, position: int) -> memoryview:
+        return self._residues[self._offsets[position]:self._offsets[position + 1]]
+
+    # A binary search of the entries, ordered by id.
+    def _find(self, entry_id: str) -> Optional[int]:
+
+        encoded_id = entry_id.encode('utf-8')
+
+        low = 0
+        high = self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._get_entry_id(self._order[middle]) < encoded_id:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < self._count and self._get_entry_id(self._order[low]) == encoded_id:
+            return self._order[low]
+
+        return None
+
+    def get(self, entry_id: str) -> Optional[memoryview]:
+        position = self._find(entry_id)
+        if position is None:
+            return None
+
+        return self._get_sequence(position)
+
+    def __contains__(self, entry_id: str) -> bool:
+        return self._find(entry_id) is not None
+
+    # The entries in the order they were written, which is the fastest way through the file.
+    def __iter__(self) -> Iterator[Tuple[str, memoryview]]:
+        for position in range(self._count):
+            yield self._get_entry_id(position).decode('utf-8'), self._get_sequence(position)
+
+    # The entries ordered by id.
+    def iterate_sorted(self) -> Iterator[Tuple[str, memoryview]]:
+        for position in self._order:
+            yield self._get_entry_id(position).decode('utf-8'), self._get_sequence(position)
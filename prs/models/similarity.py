@@ -0,0 +1,136 @@
+import logging
+from typing import List, Dict, Optional, Tuple
+
+from prs.storage import storage
+from prs.models.databank import (Databank, DATABANKS_TABLE, KMERS_ENTRIES_TABLE, ENTRIES_SEQUENCES_TABLE, ENTRIES_TABLE,
+                                 KEYS_TABLE, SEQUENCES_TABLE, get_sequence_hash)
+from prs.models.kmers import get_kmer_positions, get_best_diagonal, score_ungapped, score_banded, DEFAULT_BAND_WIDTH
+
+
+_log = logging.getLogger(__name__)
+
+
+DEFAULT_HIT_COUNT = 20
+
+# The candidates that are rescored, by the number of k-mers that they share with the query.
+DEFAULT_CANDIDATE_COUNT = 200
+
+RESCORE_METHODS = ('ungapped', 'banded')
+
+
+class SimilarityHit:
+    def __init__(self, entry_id: str, shared_kmers: int, score: Optional[int] = None):
+        self.entry_id = entry_id
+        self.shared_kmers = shared_kmers
+        self.score = score
+
+
+# Finds the sequences of a databank that share the most k-mers with a sequence, the databank must have been
+# indexed with a k-mer index, whose k-mer length is used. With a rescore method, the best candidates are aligned
+# on the diagonal that most of their shared k-mers are on and ranked by score, see score_ungapped and score_banded.
+def search_similar(databank_name: str, sequence: str, hit_count: int = DEFAULT_HIT_COUNT,
+                   rescore: Optional[str] = None, candidate_count: int = DEFAULT_CANDIDATE_COUNT,
+                   band_width: int = DEFAULT_BAND_WIDTH) -> List[SimilarityHit]:
+
+    if rescore is not None and rescore not in RESCORE_METHODS:
+        raise ValueError(f"unknown rescore method {rescore}, choose from {', '.join(RESCORE_METHODS)}")
+
+    sequence = sequence.upper()
+
+    with storage.connection() as connection:
+        cursor = connection.cursor()
+
+        databank_id = Databank.get_published_id(databank_name, cursor)
+        if databank_id is None:
+            raise ValueError(f"{databank_name} has no published build")
+
+        cursor.execute(f"select kmer_length from {DATABANKS_TABLE} where id=%s", (databank_id,))
+        kmer_length = cursor.fetchone()[0]
+        if kmer_length is None:
+            raise ValueError(f"{databank_name} was built without a k-mer index")
+
+        query_positions = get_kmer_positions(sequence, kmer_length)
+        if len(query_positions) == 0:
+            raise ValueError(f"the sequence is too short for {kmer_length}-mers")
+
+        compact, deduplicated = _get_schema(cursor)
+
+        cursor.execute(f"select entry_id, count(*) from {KMERS_ENTRIES_TABLE} where databank_id=%s and kmer = any(%s) " +
+                       "group by entry_id order by count(*) desc, entry_id limit %s",
+                       (databank_id, list(query_positions), hit_count if rescore is None else max(hit_count, candidate_count)))
+        candidates = cursor.fetchall()
+        if not compact:
+            candidates = [(entry_id.rstrip(), shared_kmers) for entry_id, shared_kmers in candidates]
+
+        if rescore is None:
+            hits = [SimilarityHit(entry_id, shared_kmers) for entry_id, shared_kmers in candidates]
+        else:
+            if deduplicated:
+                sql = f"select s.entry_id, q.sequence from {ENTRIES_SEQUENCES_TABLE} s join {SEQUENCES_TABLE} q on q.hash=s.hash " + \
+                      "where s.databank_id=%s and s.entry_id = any(%s)"
+            else:
+                sql = f"select entry_id, sequence from {ENTRIES_SEQUENCES_TABLE} where databank_id=%s and entry_id = any(%s)"
+
+            cursor.execute(sql, (databank_id, [entry_id for entry_id, shared_kmers in candidates]))
+            sequences = {entry_id if compact else entry_id.rstrip(): target for entry_id, target in cursor.fetchall()}
+
+            hits = []
+            for entry_id, shared_kmers in candidates:
+                target = sequences[entry_id]
+                diagonal = get_best_diagonal(query_positions, target, kmer_length)
+
+                if rescore == 'ungapped':
+                    score = score_ungapped(sequence, target, diagonal)
+                else:
+                    score = score_banded(sequence, target, diagonal, band_width)
+
+                hits.append(SimilarityHit(entry_id, shared_kmers, score))
+
+            hits.sort(key=lambda hit: (-hit.score, -hit.shared_kmers))
+            hits = hits[:hit_count]
+
+        if compact:
+            entry_ids = _get_entry_ids(cursor, databank_id, [hit.entry_id for hit in hits])
+
+            for hit in hits:
+                hit.entry_id = entry_ids[hit.entry_id]
+
+    return hits
+
+
+# Finds the entries of a databank with exactly this sequence. With deduplicated sequences, this is a lookup
+# of the sequence's hash, otherwise all sequences of the databank are compared.
+def search_identical(databank_name: str, sequence: str) -> List[str]:
+
+    databank_id = Databank.get_published_id(databank_name)
+    if databank_id is None:
+        raise ValueError(f"{databank_name} has no published build")
+
+    with storage.connection() as connection:
+        cursor = connection.cursor()
+
+        compact, deduplicated = _get_schema(cursor)
+        if deduplicated:
+            cursor.execute(f"select entry_id from {ENTRIES_SEQUENCES_TABLE} where databank_id=%s and hash=%s",
+                           (databank_id, get_sequence_hash(sequence)))
+        else:
+            cursor.execute(f"select entry_id from {ENTRIES_SEQUENCES_TABLE} where databank_id=%s and sequence=%s",
+                           (databank_id, sequence))
+        found_ids = [row[0] for row in cursor.fetchall()]
+
+        if compact:
+            entry_ids = _get_entry_ids(cursor, databank_id, found_ids)
+            return sorted(entry_ids[code] for code in found_ids)
+
+    return sorted(entry_id.rstrip() for entry_id in found_ids)
+
+
+# Whether the database has the compact schema and whether it has deduplicated sequences.
+def _get_schema(cursor) -> Tuple[bool, bool]:
+    cursor.execute("select to_regclass(%s) is not null, to_regclass(%s) is not null", (KEYS_TABLE, SEQUENCES_TABLE))
+    return cursor.fetchone()
+
+
+def _get_entry_ids(cursor, databank_id: int, codes: List[int]) -> Dict[int, str]:
+    cursor.execute(f"select id, entry_id from {ENTRIES_TABLE} where databank_id=%s and id = any(%s)", (databank_id, codes))
+    return dict(cursor.fetchall())
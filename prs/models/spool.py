@@ -0,0 +1,227 @@
+import io
+import os
+import shutil
+from queue import Queue
+from typing import IO, Optional
+
+
+# The spools count their rows, and the bytes of them as characters, which the rows almost only consist of.
+class FileSpool:
+    # With a resume_size, the rows of an earlier session are kept up to that size and appended to.
+    def __init__(self, path: str, buffer_size: int, resume_size: Optional[int] = None, row_count: int = 0):
+        self.path = path
+        self.row_count = row_count
+        self.byte_count = resume_size or 0
+
+        if resume_size is None:
+            self._file = open(path, 'wt', buffering=buffer_size)
+        else:
+            os.truncate(path, resume_size)
+            self._file = open(path, 'at', buffering=buffer_size)
+
+    def write(self, row: str):
+        self._file.write(row)
+        self.row_count += 1
+        self.byte_count += len(row)
+
+    def flush(self):
+        self._file.flush()
+
+    # The number of bytes written, after a flush.
+    @property
+    def size(self) -> int:
+        return os.fstat(self._file.fileno()).st_size
+
+    def append(self, spool: 'FileSpool'):
+        with spool.open() as f:
+            shutil.copyfileobj(f, self._file)
+
+        self.row_count += spool.row_count
+        self.byte_count += spool.byte_count
+
+    def close(self):
+        self._file.close()
+
+    def open(self) -> IO:
+        return open(self.path, 'rt')
+
+    # A closed spool can be sent back from a worker process.
+    def __getstate__(self):
+        return {'path': self.path, 'row_count': self.row_count, 'byte_count': self.byte_count}
+
+
+class MemorySpool:
+    def __init__(self):
+        self.row_count = 0
+        self.byte_count = 0
+
+        self._buffer = io.StringIO()
+
+    def write(self, row: str):
+        self._buffer.write(row)
+        self.row_count += 1
+        self.byte_count += len(row)
+
+    def append(self, spool: FileSpool):
+        with spool.open() as f:
+            shutil.copyfileobj(f, self._buffer)
+
+        self.row_count += spool.row_count
+        self.byte_count += spool.byte_count
+
+    def close(self):
+        pass
+
+    # The rows can be read more than once, one reader at a time.
+    def open(self) -> IO:
+        return MemoryReader(self._buffer)
+
+
+# Reads a buffer from the start, closing the reader leaves the buffer open.
+class MemoryReader(io.TextIOBase):
+    def __init__(self, buffer: io.StringIO):
+        self._buffer = buffer
+        self._buffer.seek(0)
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        return self._buffer.read(size)
+
+    def readline(self, size: int = -1) -> str:
+        return self._buffer.readline(size)
+
+
+# Counts the rows and drops them, so that the indexers can be measured without postgres.
+class NullSpool:
+    def __init__(self):
+        self.row_count = 0
+        self.byte_count = 0
+
+    def write(self, row: str):
+        self.row_count += 1
+        self.byte_count += len(row)
+
+    def append(self, spool: FileSpool):
+        self.row_count += spool.row_count
+        self.byte_count += spool.byte_count
+
+    def close(self):
+        pass
+
+
+class SpoolAborted(Exception):
+    pass
+
+
+# Hands the rows over to a reader in another thread, in chunks.
+# Writing blocks while the queue is full, so that the writer cannot run too far ahead.
+class QueueSpool:
+    def __init__(self, queue_size: int, chunk_size: int):
+        self.row_count = 0
+        self.byte_count = 0
+
+        self._queue = Queue(queue_size)
+        self._chunk_size = chunk_size
+        self._chunk = []
+        self._chunk_length = 0
+        self._closed = False
+        self._error = None
+        self._reader = None
+
+    def write(self, row: str):
+        self._chunk.append(row)
+        self._chunk_length += len(row)
+        self.row_count += 1
+        self.byte_count += len(row)
+
+        if self._chunk_length >= self._chunk_size:
+            self._flush()
+
+    def append(self, spool: FileSpool):
+        self._flush()
+
+        with spool.open() as f:
+            while True:
+                data = f.read(self._chunk_size)
+                if len(data) == 0:
+                    break
+
+                self._put(data)
+
+        self.row_count += spool.row_count
+        self.byte_count += spool.byte_count
+
+    def _flush(self):
+        if len(self._chunk) > 0:
+            self._put(''.join(self._chunk))
+
+            self._chunk = []
+            self._chunk_length = 0
+
+    def _put(self, data: str):
+        # Don't let the writer go on when the reader gave up.
+        if self._error is not None:
+            raise self._error
+
+        self._queue.put(data)
+
+    # The reader gets to the end even when the last rows cannot be handed over, since it failed.
+    def close(self):
+        if not self._closed:
+            try:
+                self._flush()
+            finally:
+                self._queue.put(None)
+
+                self._closed = True
+
+    # Makes the reader raise SpoolAborted.
+    def abort(self):
+        if not self._closed:
+            self._queue.put(SpoolAborted())
+
+            self._closed = True
+
+    # Called by the reader's thread when it cannot go on, the rest of the rows are then discarded.
+    def fail(self, error: Exception):
+        self._error = error
+
+        if self._reader is None or not self._reader.done:
+            while True:
+                data = self._queue.get()
+                if data is None or isinstance(data, SpoolAborted):
+                    break
+
+    def open(self) -> IO:
+        self._reader = QueueReader(self._queue)
+        return self._reader
+
+
+class QueueReader(io.TextIOBase):
+    def __init__(self, queue: Queue):
+        self._queue = queue
+        self._data = ""
+        self.done = False
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        while not self.done and (size < 0 or len(self._data) < size):
+            data = self._queue.get()
+            if data is None:
+                self.done = True
+
+            elif isinstance(data, SpoolAborted):
+                self.done = True
+                raise data
+            else:
+                self._data += data
+
+        if size < 0:
+            size = len(self._data)
+
+        data, self._data = self._data[:size], self._data[size:]
+        return data
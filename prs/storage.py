@@ -1,12 +1,88 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+
+DEFAULT_DSN = "dbname=prs"
+DEFAULT_MAX_CONNECTIONS = 8
 
 
 class Storage:
-    def __init__(self):
-        self._db_name = "prs"
+    def __init__(self, dsn: Optional[str] = None, max_connections: int = DEFAULT_MAX_CONNECTIONS):
+        self._dsn = dsn or os.environ.get("PRS_DSN", DEFAULT_DSN)
+        self._max_connections = max_connections
+
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+        self._available = None
+
+    @property
+    def dsn(self) -> str:
+        return self._dsn
+
+    def configure(self, dsn: Optional[str] = None, max_connections: Optional[int] = None):
+        self.close()
+
+        if dsn is not None:
+            self._dsn = dsn
+
+        if max_connections is not None:
+            self._max_connections = max_connections
 
+    # Opens a connection outside the pool, the caller must close it.
     def connect(self):
-        return psycopg2.connect(f"dbname={self._db_name}")
+        return psycopg2.connect(self._dsn)
+
+    def _get_pool(self) -> ThreadedConnectionPool:
+        with self._lock:
+            # A pool inherited from a parent process must not be shared with it.
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ThreadedConnectionPool(0, self._max_connections, self._dsn)
+                self._pool_pid = os.getpid()
+                self._available = threading.BoundedSemaphore(self._max_connections)
+
+            return self._pool
+
+    # Blocks until a connection is available when all of them are checked out.
+    def checkout(self):
+        pool = self._get_pool()
+        available = self._available
+
+        available.acquire()
+        try:
+            return pool.getconn()
+        except:
+            available.release()
+            raise
+
+    def checkin(self, connection, close: bool = False):
+        self._pool.putconn(connection, close=close)
+        self._available.release()
+
+    @contextmanager
+    def connection(self):
+        connection = self.checkout()
+        try:
+            yield connection
+            connection.commit()
+        except:
+            connection.rollback()
+            raise
+        finally:
+            self.checkin(connection)
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.closeall()
+
+            self._pool = None
+            self._pool_pid = None
 
 
 storage = Storage()
@@ -0,0 +1,81 @@
+import sys
+import os
+import logging
+import random
+from argparse import ArgumentParser
+from timeit import timeit
+from typing import Dict, List
+
+root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_path)
+from prs.indexers.cif import read_mmcif
+from prs.indexers.mmcif import (MMCIF_CATEGORIES, AMINO_ACID_ONE_LETTER_CODES,
+                                scan_atom_sites_reference, scan_atom_sites)
+
+
+RESIDUE_ATOM_NAMES = ['N', 'CA', 'C', 'O', 'CB', 'CG', 'CD']
+LIGAND_NAMES = ['HOH', 'ATP', 'MG', 'ZN', 'SO4', 'GOL']
+
+
+# The _atom_site columns of a structure like a ribosome or a capsid, with many chains and models.
+def generate_atom_sites(chain_count: int, residue_count: int, model_count: int) -> Dict[str, List[str]]:
+    atoms = {item: [] for item in MMCIF_CATEGORIES['_atom_site']}
+    residue_names = list(AMINO_ACID_ONE_LETTER_CODES) + ['MSE', 'UNK']
+
+    def add_atom(group: str, model_number: int, residue_name: str, chain_id: str, atom_name: str, alt_id: str):
+        atoms['id'].append(str(len(atoms['id']) + 1))
+        atoms['group_PDB'].append(group)
+        atoms['pdbx_PDB_model_num'].append(str(model_number))
+        atoms['auth_comp_id'].append(residue_name)
+        atoms['label_asym_id'].append(chain_id)
+        atoms['auth_atom_id'].append(atom_name)
+        atoms['label_alt_id'].append(alt_id)
+
+    for model_number in range(1, model_count + 1):
+        for chain_index in range(chain_count):
+            chain_id = f"{chr(ord('A') + chain_index % 26)}{chain_index // 26 or ''}"
+
+            for residue_index in range(residue_count):
+                residue_name = random.choice(residue_names)
+                alt_ids = ['A', 'B'] if random.random() < 0.05 else ['.']
+
+                for alt_id in alt_ids:
+                    for atom_name in RESIDUE_ATOM_NAMES:
+                        add_atom("ATOM", model_number, residue_name, chain_id, atom_name, alt_id)
+
+            for ligand_index in range(residue_count // 10):
+                add_atom("HETATM", model_number, random.choice(LIGAND_NAMES), chain_id, 'C1', '.')
+
+    return atoms
+
+
+arg_parser = ArgumentParser(description="compare the speed of the atom site scans on large structures")
+arg_parser.add_argument("cif_paths", nargs="*", help="structures to take the atom sites from, instead of generated ones")
+arg_parser.add_argument("--chains", type=int, default=60, help="number of chains to generate")
+arg_parser.add_argument("--residues", type=int, default=1000, help="number of residues to generate per chain")
+arg_parser.add_argument("--models", type=int, default=2, help="number of models to generate")
+arg_parser.add_argument("--repeat", type=int, default=3, help="number of times to scan every structure")
+
+
+if __name__ == "__main__":
+
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    if len(args.cif_paths) > 0:
+        structures = {heading: block['_atom_site']
+                      for cif_path in args.cif_paths
+                      for heading, block in read_mmcif(cif_path, {'_atom_site': MMCIF_CATEGORIES['_atom_site']})}
+    else:
+        structures = {'generated': generate_atom_sites(args.chains, args.residues, args.models)}
+
+    for name, atoms in structures.items():
+        if scan_atom_sites(atoms) != scan_atom_sites_reference(atoms):
+            logging.error(f"{name}: the columnar scan differs from the reference")
+
+        reference_seconds = timeit(lambda: scan_atom_sites_reference(atoms), number=args.repeat) / args.repeat
+        columnar_seconds = timeit(lambda: scan_atom_sites(atoms), number=args.repeat) / args.repeat
+
+        logging.info(f"{name}: {len(atoms['id'])} atoms, reference {1000 * reference_seconds:.1f} ms, " +
+                     f"columnar {1000 * columnar_seconds:.1f} ms, speedup {reference_seconds / columnar_seconds:.1f}x")
@@ -0,0 +1,422 @@
+import sys
+import os
+import gzip
+import json
+import shutil
+import logging
+import tempfile
+from random import Random
+from argparse import ArgumentParser
+from contextlib import ExitStack
+from datetime import date, timedelta
+from time import time
+from typing import Callable, Dict, List, Tuple
+
+root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_path)
+from prs.storage import storage
+from prs.indexers.uniprot import index_uniprot_file, index_uniprot_parallel
+from prs.indexers.mmcif import index_mmcif_files, index_mmcif_parallel, AMINO_ACID_ONE_LETTER_CODES
+from prs.indexers.pdb import index_pdb
+from prs.models.databank import Databank, NullDatabank, get_peak_rss
+
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+THREE_LETTER_CODES = {one_letter_code: three_letter_code
+                      for three_letter_code, one_letter_code in AMINO_ACID_ONE_LETTER_CODES.items()
+                      if one_letter_code in AMINO_ACIDS}
+MONTHS = ["JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC"]
+
+# words to make up descriptions, comments and titles from, as common in uniprot_sprot.dat
+VOCABULARY = """
+kinase protein binding domain transferase receptor membrane activity regulation catalytic subunit complex
+phosphorylation signaling cell nucleus cytoplasm mitochondrion transport channel enzyme hydrolase oxidoreductase
+family superfamily zinc calcium magnesium ion dependent interacts with involved in required for the of and by
+transcription factor DNA RNA ribosomal synthase dehydrogenase reductase isomerase ligase homodimer heterodimer
+apoptosis proliferation differentiation migration adhesion development response stress inflammation immune
+""".split()
+
+SPECIES = [("HUMAN", "Homo sapiens (Human)", "Eukaryota; Metazoa; Chordata; Craniata; Vertebrata; Mammalia."),
+           ("MOUSE", "Mus musculus (Mouse)", "Eukaryota; Metazoa; Chordata; Craniata; Vertebrata; Mammalia."),
+           ("YEAST", "Saccharomyces cerevisiae (Baker's yeast)", "Eukaryota; Fungi; Dikarya; Ascomycota."),
+           ("ECOLI", "Escherichia coli (strain K12)", "Bacteria; Pseudomonadota; Gammaproteobacteria.")]
+
+RESIDUE_ATOM_NAMES = ['N', 'CA', 'C', 'O', 'CB', 'CG', 'CD', 'CE']
+LIGAND_NAMES = ['ATP', 'MG', 'ZN', 'SO4', 'GOL', 'HEM']
+RESIDUES_PER_CHAIN = 300
+
+
+def _make_words(rng: Random, count: int) -> str:
+    return ' '.join(rng.choice(VOCABULARY) for _ in range(count))
+
+
+def _make_date(rng: Random) -> date:
+    return date(1986, 1, 1) + timedelta(days=rng.randrange(13000))
+
+
+def _make_sequence(rng: Random, mean_length: int) -> str:
+    length = max(10, int(rng.gauss(mean_length, mean_length / 3)))
+    return ''.join(rng.choices(AMINO_ACIDS, k=length))
+
+
+# Wraps the text over lines like the flat files do, the first line may have a prefix of its own.
+def _make_lines(prefix: str, text: str, first_prefix: str = None, width: int = 75) -> List[str]:
+    lines = []
+    line = first_prefix or prefix
+    for word in text.split():
+        if len(line) + len(word) + 1 > width and len(line) > len(prefix):
+            lines.append(line.rstrip())
+            line = prefix
+
+        line += word + ' '
+
+    lines.append(line.rstrip())
+
+    return lines
+
+
+# Swiss-Prot entries carry more annotation than the unreviewed TrEMBL ones.
+def generate_uniprot_entry(rng: Random, index: int, sequence_length: int, reviewed: bool) -> str:
+
+    species_code, species_name, lineage = rng.choice(SPECIES)
+    name = f"{'P' if reviewed else 'T'}{index:06d}_{species_code}"
+    accession = f"{'PQ'[index % 2]}{index:05d}"
+    sequence = _make_sequence(rng, sequence_length)
+
+    def format_date(date_: date) -> str:
+        return f"{date_.day:02d}-{MONTHS[date_.month - 1]}-{date_.year}"
+
+    lines = [f"ID   {name:<24}{'Reviewed' if reviewed else 'Unreviewed'};{len(sequence):>11} AA.",
+             f"AC   {accession}; A{index:05d};",
+             f"DT   {format_date(_make_date(rng))}, integrated into UniProtKB/{'Swiss-Prot' if reviewed else 'TrEMBL'}.",
+             f"DT   {format_date(_make_date(rng))}, sequence version 1.",
+             f"DT   {format_date(_make_date(rng))}, entry version {rng.randrange(1, 200)}."]
+
+    lines += [f"DE   RecName: Full={_make_words(rng, 4).capitalize()};",
+              f"DE            EC=2.7.{rng.randrange(1, 20)}.{rng.randrange(1, 200)};"]
+    lines += [f"GN   Name={_make_words(rng, 1).upper()}{rng.randrange(1, 10)}; Synonyms=G{index};",
+              f"OS   {species_name}.",
+              f"OC   {lineage}",
+              f"OX   NCBI_TaxID={rng.randrange(1, 100000)};"]
+
+    for reference_index in range(1, (rng.randrange(2, 6) if reviewed else 2)):
+        lines += [f"RN   [{reference_index}]",
+                  "RP   NUCLEOTIDE SEQUENCE [MRNA].",
+                  f"RX   PubMed={rng.randrange(1000000, 40000000)}; DOI=10.{rng.randrange(1000, 9999)}/j.{index};",
+                  "RA   Smith J., Jones K., Garcia M.;"]
+        lines += _make_lines("RT   ", f'"{_make_words(rng, 12)}";')
+        lines.append(f"RL   J. Biol. Chem. {rng.randrange(100, 300)}:{rng.randrange(1, 9999)}-{rng.randrange(1, 9999)}(2001).")
+
+    if reviewed:
+        for topic in ["FUNCTION", "SUBUNIT", "SUBCELLULAR LOCATION", "SIMILARITY"]:
+            lines += _make_lines("CC       ", f"{topic}: {_make_words(rng, rng.randrange(10, 60))}.", "CC   -!- ")
+
+    for dr_index in range(rng.randrange(2, 12)):
+        lines.append(f"DR   PDB; {rng.randrange(1, 10)}{_make_words(rng, 1)[:3].upper()}; X-ray; 1.{dr_index}0 A; A=1-{len(sequence)}.")
+
+    lines.append(f"KW   {'; '.join(word.capitalize() for word in rng.sample(VOCABULARY, 4))}.")
+    lines.append(f"FT   DOMAIN          1..{len(sequence)}")
+    lines.append(f"SQ   SEQUENCE   {len(sequence)} AA;  {len(sequence) * 110} MW;  {rng.getrandbits(64):016X} CRC64;")
+
+    for start in range(0, len(sequence), 60):
+        line = sequence[start: start + 60]
+        lines.append("     " + ' '.join(line[block: block + 10] for block in range(0, len(line), 10)))
+
+    lines.append("//")
+
+    return '\n'.join(lines) + '\n'
+
+
+def generate_uniprot_file(path: str, entry_count: int, sequence_length: int, reviewed: bool, seed: int):
+    rng = Random(seed)
+
+    with open(path, 'wt') as f:
+        for index in range(entry_count):
+            f.write(generate_uniprot_entry(rng, index, sequence_length, reviewed))
+
+
+# The chains of a structure, as lists of residue names.
+def _make_chains(rng: Random, atom_count: int) -> List[List[str]]:
+    residue_count = max(1, atom_count // len(RESIDUE_ATOM_NAMES))
+    chain_count = max(1, (residue_count + RESIDUES_PER_CHAIN - 1) // RESIDUES_PER_CHAIN)
+
+    return [[THREE_LETTER_CODES[rng.choice(AMINO_ACIDS)] for _ in range(residue_count // chain_count)]
+            for _ in range(chain_count)]
+
+
+def _chain_id(chain_index: int) -> str:
+    return chr(ord('A') + chain_index % 26) + ('' if chain_index < 26 else str(chain_index // 26))
+
+
+def generate_mmcif_entry(rng: Random, pdb_id: str, atom_count: int, model_count: int) -> str:
+
+    chains = _make_chains(rng, atom_count)
+
+    lines = [f"data_{pdb_id}", "#", f"_entry.id   {pdb_id}", "#",
+             f"_struct_keywords.entry_id        {pdb_id}",
+             "_struct_keywords.pdbx_keywords   TRANSFERASE",
+             f"_struct_keywords.text            '{_make_words(rng, 4)}'", "#",
+             "_exptl.entry_id " + pdb_id, "_exptl.method 'X-RAY DIFFRACTION'", "#",
+             "_refine.entry_id " + pdb_id, f"_refine.ls_d_res_high {rng.uniform(1.0, 3.5):.2f}", "#",
+             "_struct.title", ";" + _make_words(rng, 10), ";", "#"]
+
+    lines += ["loop_", "_entity.id", "_entity.type", "_entity.src_method", "_entity.pdbx_description",
+              "_entity.formula_weight", "_entity.pdbx_number_of_molecules", "_entity.pdbx_ec",
+              "_entity.pdbx_mutation", "_entity.pdbx_fragment", "_entity.details",
+              f"1 polymer man '{_make_words(rng, 3)}' 35000.0 {len(chains)} 2.7.11.1 ? ? ?",
+              f"2 non-polymer syn '{_make_words(rng, 2)}' 507.2 1 ? ? ? ?", "#"]
+
+    lines += ["_entity_name_com.entity_id   1", f"_entity_name_com.name        '{_make_words(rng, 2)}'", "#",
+              "_entity_poly.entity_id   1", "_entity_poly.type        'polypeptide(L)'", "#"]
+
+    lines += ["loop_", "_audit_author.name", "_audit_author.pdbx_ordinal"]
+    lines += [f"'{name}, {initial}.' {ordinal}" for ordinal, (name, initial) in
+              enumerate([("Smith", "J"), ("Jones", "K"), ("Garcia", "M")][:rng.randrange(1, 4)], 1)]
+    lines += ["#", "loop_", "_citation.id", "_citation.title", "_citation.journal_abbrev", "_citation.year",
+              f"primary '{_make_words(rng, 8)}' Nature {rng.randrange(1980, 2024)}", "#"]
+
+    lines += ["loop_", "_struct_ref.id", "_struct_ref.db_name", "_struct_ref.db_code", "_struct_ref.pdbx_db_accession",
+              f"1 UNP P{rng.randrange(100000):06d}_HUMAN P{rng.randrange(100000):05d}", "#"]
+
+    lines += ["loop_", "_pdbx_poly_seq_scheme.asym_id", "_pdbx_poly_seq_scheme.entity_id",
+              "_pdbx_poly_seq_scheme.seq_id", "_pdbx_poly_seq_scheme.mon_id"]
+    for chain_index, residue_names in enumerate(chains):
+        lines += [f"{_chain_id(chain_index)} 1 {seq_id} {residue_name}" for seq_id, residue_name in enumerate(residue_names, 1)]
+
+    lines += ["#", "loop_"] + [f"_atom_site.{item}" for item in
+                                ['group_PDB', 'id', 'type_symbol', 'label_atom_id', 'label_alt_id', 'label_comp_id',
+                                 'label_asym_id', 'label_seq_id', 'Cartn_x', 'Cartn_y', 'Cartn_z', 'occupancy',
+                                 'B_iso_or_equiv', 'auth_comp_id', 'auth_asym_id', 'auth_atom_id', 'pdbx_PDB_model_num']]
+    atom_id = 0
+    for model_number in range(1, model_count + 1):
+        for chain_index, residue_names in enumerate(chains):
+            chain_id = _chain_id(chain_index)
+            for seq_id, residue_name in enumerate(residue_names, 1):
+                alt_ids = ['A', 'B'] if rng.random() < 0.02 else ['.']
+                for alt_id in alt_ids:
+                    for atom_name in RESIDUE_ATOM_NAMES:
+                        atom_id += 1
+                        lines.append(f"ATOM {atom_id} {atom_name[0]} {atom_name} {alt_id} {residue_name} {chain_id} {seq_id} " +
+                                     f"{rng.uniform(-50, 50):.3f} {rng.uniform(-50, 50):.3f} {rng.uniform(-50, 50):.3f} " +
+                                     f"1.00 {rng.uniform(5, 80):.2f} {residue_name} {chain_id} {atom_name} {model_number}")
+
+            ligand_name = rng.choice(LIGAND_NAMES)
+            atom_id += 1
+            lines.append(f"HETATM {atom_id} C C1 . {ligand_name} {chain_id} . 0.000 0.000 0.000 1.00 30.00 " +
+                         f"{ligand_name} {chain_id} C1 {model_number}")
+    lines.append("#")
+
+    return '\n'.join(lines) + '\n'
+
+
+def generate_pdb_entry(rng: Random, pdb_id: str, atom_count: int, model_count: int) -> str:
+
+    chains = _make_chains(rng, atom_count)
+    deposition_date = _make_date(rng)
+    date_s = f"{deposition_date.day:02d}-{MONTHS[deposition_date.month - 1]}-{deposition_date.year % 100:02d}"
+
+    lines = [f"HEADER    {'TRANSFERASE':<40}{date_s}   {pdb_id}",
+             f"TITLE     {_make_words(rng, 10).upper()}",
+             f"COMPND   2 MOLECULE: {_make_words(rng, 3).upper()};",
+             "COMPND   3 EC: 2.7.11.1;",
+             "SOURCE   2 ORGANISM_SCIENTIFIC: HOMO SAPIENS;",
+             f"KEYWDS    {', '.join(rng.sample(VOCABULARY, 4)).upper()}",
+             "EXPDTA    X-RAY DIFFRACTION",
+             "AUTHOR    J.SMITH,K.JONES,M.GARCIA",
+             f"REVDAT   1   {date_s} {pdb_id}    0",
+             f"JRNL        TITL   {_make_words(rng, 8).upper()}",
+             f"REMARK   2 RESOLUTION.    {rng.uniform(1.0, 3.5):.2f} ANGSTROMS."]
+
+    for chain_index, residue_names in enumerate(chains):
+        chain_id = _chain_id(chain_index)[0]
+        lines.append(f"DBREF  {pdb_id} {chain_id}    1   {len(residue_names):>4}  UNP    P{rng.randrange(100000):05d}   " +
+                     f"P{rng.randrange(100000):06d}_HUMAN      1   {len(residue_names):>4}")
+
+    for chain_index, residue_names in enumerate(chains):
+        chain_id = _chain_id(chain_index)[0]
+        for line_index, start in enumerate(range(0, len(residue_names), 13), 1):
+            lines.append(f"SEQRES {line_index:>3} {chain_id} {len(residue_names):>4}  {' '.join(residue_names[start: start + 13])}")
+
+    atom_id = 0
+    for model_number in range(1, model_count + 1):
+        if model_count > 1:
+            lines.append(f"MODEL     {model_number:>4}")
+
+        for chain_index, residue_names in enumerate(chains):
+            chain_id = _chain_id(chain_index)[0]
+            for residue_number, residue_name in enumerate(residue_names, 1):
+                for atom_name in RESIDUE_ATOM_NAMES:
+                    atom_id += 1
+                    lines.append(f"ATOM  {atom_id % 100000:>5} {atom_name:<4} {residue_name:>3} {chain_id}{residue_number % 10000:>4}    " +
+                                 f"{rng.uniform(-50, 50):8.3f}{rng.uniform(-50, 50):8.3f}{rng.uniform(-50, 50):8.3f}" +
+                                 f"  1.00{rng.uniform(5, 80):6.2f}           {atom_name[0]}")
+
+            ligand_name = rng.choice(LIGAND_NAMES)
+            atom_id += 1
+            lines.append(f"HETATM{atom_id % 100000:>5}  C1  {ligand_name:>3} {chain_id}{len(residue_names) + 1:>4}    " +
+                         "   0.000   0.000   0.000  1.00 30.00           C")
+
+        if model_count > 1:
+            lines.append("ENDMDL")
+
+    lines.append("END")
+
+    return '\n'.join(lines) + '\n'
+
+
+# Writes every structure both as a gzipped mmCIF file and as a PDB file.
+def generate_structures(directory_path: str, structure_count: int, atom_count: int, model_count: int,
+                        seed: int) -> Tuple[List[str], List[str]]:
+    rng = Random(seed)
+
+    cif_paths = []
+    pdb_paths = []
+    for index in range(structure_count):
+        pdb_id = f"{1 + index // 4096 % 9}{index % 4096:03X}"
+
+        cif_path = os.path.join(directory_path, f"{pdb_id.lower()}.cif.gz")
+        with gzip.open(cif_path, 'wt') as f:
+            f.write(generate_mmcif_entry(rng, pdb_id, atom_count, model_count))
+        cif_paths.append(cif_path)
+
+        pdb_path = os.path.join(directory_path, f"pdb{pdb_id.lower()}.ent")
+        with open(pdb_path, 'wt') as f:
+            f.write(generate_pdb_entry(rng, pdb_id, atom_count, model_count))
+        pdb_paths.append(pdb_path)
+
+    return cif_paths, pdb_paths
+
+
+def run_phase(name: str, databanks: List[Databank], entry_count: int, index: Callable[[], None]) -> Dict:
+
+    start = time()
+    with ExitStack() as stack:
+        for databank in databanks:
+            stack.enter_context(databank)
+
+        index()
+
+        index_seconds = time() - start
+
+    publish_seconds = time() - start - index_seconds
+
+    row_counts = {}
+    for databank in databanks:
+        for table, count in databank.row_counts.items():
+            row_counts[table] = row_counts.get(table, 0) + count
+
+    result = {'name': name, 'entries': entry_count, 'index_seconds': index_seconds, 'publish_seconds': publish_seconds,
+              'rows': row_counts, 'peak_rss_kb': get_peak_rss()[0]}
+
+    logging.info(f"{name}: {entry_count} entries in {index_seconds:.2f} s, {entry_count / index_seconds:.0f} entries/s" +
+                 (f", publishing took {publish_seconds:.2f} s" if publish_seconds >= 0.01 else ""))
+    for table, count in row_counts.items():
+        if count > 0:
+            logging.info(f"{name}: {count} rows for {table}, {count / index_seconds:.0f} rows/s")
+
+    return result
+
+
+arg_parser = ArgumentParser(description="measure the indexers on generated UniProt and PDB entries")
+arg_parser.add_argument("--entries", type=int, default=10000, help="number of UniProt entries to generate per file")
+arg_parser.add_argument("--sequence-length", type=int, default=400, help="mean length of the UniProt sequences")
+arg_parser.add_argument("--structures", type=int, default=100, help="number of structures to generate")
+arg_parser.add_argument("--atoms", type=int, default=5000, help="number of atoms per model of every structure")
+arg_parser.add_argument("--models", type=int, default=1, help="number of models per structure")
+arg_parser.add_argument("--workers", type=int, default=1, help="number of processes to index with")
+arg_parser.add_argument("--seed", type=int, default=1, help="seed of the generators")
+arg_parser.add_argument("--postgres", action="store_true",
+                        help="store the rows in the databanks of the database, which should be a scratch one")
+arg_parser.add_argument("--dsn", help="database to store the rows in with --postgres")
+arg_parser.add_argument("--json", help="also write the results to this file")
+
+
+if __name__ == "__main__":
+
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    if args.dsn is not None:
+        storage.configure(args.dsn)
+
+    def open_databank(name: str) -> Databank:
+        if args.postgres:
+            return Databank(name)
+        else:
+            return NullDatabank(name)
+
+    directory_path = tempfile.mkdtemp(prefix="prs_benchmark_")
+    try:
+        start = time()
+
+        sprot_path = os.path.join(directory_path, "uniprot_sprot.dat")
+        trembl_path = os.path.join(directory_path, "uniprot_trembl.dat")
+        generate_uniprot_file(sprot_path, args.entries, args.sequence_length, True, args.seed)
+        generate_uniprot_file(trembl_path, args.entries, args.sequence_length, False, args.seed + 1)
+
+        cif_paths, pdb_paths = generate_structures(directory_path, args.structures, args.atoms, args.models, args.seed)
+
+        logging.info(f"generating the input took {time() - start:.2f} s")
+
+        def index_uniprot_path(path: str, databank: Databank):
+            if args.workers > 1:
+                index_uniprot_parallel(path, databank, args.workers)
+            else:
+                index_uniprot_file(path, databank)
+
+        def index_pdb_paths(atom_databank: Databank, seqres_databank: Databank):
+            for pdb_path in pdb_paths:
+                with open(pdb_path, 'rt') as f:
+                    index_pdb(f, atom_databank, seqres_databank)
+
+        # The structures link to both UniProt databanks, so those go first.
+        sprot_db = open_databank("sprot")
+        uniprot_db = open_databank("uniprot")
+        results = [run_phase("sprot", [sprot_db], args.entries, lambda: index_uniprot_path(sprot_path, sprot_db)),
+                   run_phase("trembl", [uniprot_db], args.entries, lambda: index_uniprot_path(trembl_path, uniprot_db))]
+
+        atom_db = open_databank("pdb_atom")
+        seqres_db = open_databank("pdb_seqres")
+        if args.workers > 1:
+            results.append(run_phase("mmcif", [atom_db, seqres_db], len(cif_paths),
+                                     lambda: index_mmcif_parallel(cif_paths, atom_db, seqres_db, args.workers)))
+        else:
+            results.append(run_phase("mmcif", [atom_db, seqres_db], len(cif_paths),
+                                     lambda: index_mmcif_files(cif_paths, atom_db, seqres_db)))
+
+        # index_pdb is not part of the build, and stores the method as a unique string, which postgres would refuse.
+        atom_db = NullDatabank("pdb_atom")
+        seqres_db = NullDatabank("pdb_seqres")
+        results.append(run_phase("pdb", [atom_db, seqres_db], len(pdb_paths), lambda: index_pdb_paths(atom_db, seqres_db)))
+
+        # The tokenizer on its own, on the comments of the generated Swiss-Prot entries.
+        comments = []
+        with open(sprot_path, 'rt') as f:
+            comment = ""
+            for line in f:
+                if line.startswith("CC   "):
+                    comment += line[5:]
+
+                elif line.startswith("//"):
+                    comments.append(comment)
+                    comment = ""
+
+        start = time()
+        word_count = sum(len(Databank._get_words(comment)) for comment in comments)
+        words_seconds = time() - start
+
+        logging.info(f"words: {len(comments)} comments in {words_seconds:.2f} s, {word_count / words_seconds:.0f} words/s")
+        results.append({'name': 'words', 'entries': len(comments), 'index_seconds': words_seconds,
+                        'publish_seconds': 0.0, 'rows': {'words': word_count}, 'peak_rss_kb': get_peak_rss()[0]})
+
+        peak_rss, peak_children_rss = get_peak_rss()
+        logging.info(f"peak RSS {peak_rss / 1024:.0f} MiB" +
+                     (f", {peak_children_rss / 1024:.0f} MiB in the workers" if args.workers > 1 else ""))
+
+        if args.json is not None:
+            with open(args.json, 'wt') as f:
+                json.dump({'arguments': vars(args), 'phases': results,
+                           'peak_rss_kb': peak_rss, 'peak_children_rss_kb': peak_children_rss}, f, indent=2)
+    finally:
+        shutil.rmtree(directory_path)
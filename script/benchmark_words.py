@@ -0,0 +1,113 @@
+import sys
+import os
+import logging
+from argparse import ArgumentParser
+from timeit import timeit
+from typing import List
+
+root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_path)
+from prs.models.databank import Databank
+
+
+# CC blocks as found in uniprot_sprot.dat, with the line prefixes removed
+CC_BLOCKS = [
+    """-!- FUNCTION: Calcium-activated, phospholipid- and diacylglycerol (DAG)-
+    dependent serine/threonine-protein kinase that is involved in positive
+    and negative regulation of cell proliferation, apoptosis,
+    differentiation, migration and adhesion, tumorigenesis, cardiac
+    hypertrophy, angiogenesis, platelet function and inflammation, by
+    directly phosphorylating targets such as RAF1, BCL2, CSPG4, TNNT2/CTNT,
+    or activating signaling cascade involving MAPK1/3 (ERK1/2) and RAP1GAP.
+    {ECO:0000269|PubMed:10848585, ECO:0000269|PubMed:11909823}.
+-!- CATALYTIC ACTIVITY:
+    Reaction=L-seryl-[protein] + ATP = O-phospho-L-seryl-[protein] + ADP +
+      H(+); Xref=Rhea:RHEA:17989, Rhea:RHEA-COMP:9863, Rhea:RHEA-
+      COMP:11604, ChEBI:CHEBI:15378, ChEBI:CHEBI:29999, ChEBI:CHEBI:30616,
+      ChEBI:CHEBI:83421, ChEBI:CHEBI:456216; EC=2.7.11.13;
+-!- COFACTOR:
+    Name=Ca(2+); Xref=ChEBI:CHEBI:29108;
+    Evidence={ECO:0000250|UniProtKB:P05696};
+-!- ACTIVITY REGULATION: Classical (or conventional) PKCs (PRKCA, PRKCB and
+    PRKCG) are activated by calcium and diacylglycerol (DAG) in the presence
+    of phosphatidylserine. Three specific sites; Thr-497 (activation loop of
+    the kinase domain), Thr-638 (turn motif) and Ser-657 (hydrophobic region),
+    need to be phosphorylated for its full activation.
+-!- SUBUNIT: Interacts with ADAP1/CENTA1, CSPG4 and PRKCABP. Binds to CAVIN2
+    in the presence of phosphatidylserine. {ECO:0000269|PubMed:15851033}.
+-!- SUBCELLULAR LOCATION: Cytoplasm. Cell membrane; Peripheral membrane
+    protein. Mitochondrion membrane; Peripheral membrane protein. Nucleus.
+-!- SIMILARITY: Belongs to the protein kinase superfamily. AGC Ser/Thr
+    protein kinase family. PKC subfamily. {ECO:0000305}.
+""",
+    """-!- FUNCTION: Acts as a tumor suppressor in many tumor types; induces
+    growth arrest or apoptosis depending on the physiological circumstances
+    and cell type. Involved in cell cycle regulation as a trans-activator
+    that acts to negatively regulate cell division by controlling a set of
+    genes required for this process. {ECO:0000269|PubMed:11025664,
+    ECO:0000269|PubMed:12524540, ECO:0000269|PubMed:12810724}.
+-!- COFACTOR:
+    Name=Zn(2+); Xref=ChEBI:CHEBI:29105;
+    Note=Binds 1 zinc ion per subunit.;
+-!- SUBUNIT: Forms homodimers and homotetramers. Binds DNA as a homotetramer.
+    Interacts with AXIN1. Probably part of a complex consisting of TP53,
+    HIPK2 and AXIN1. Interacts with histone acetyltransferases EP300 and
+    methyltransferases HRMT1L2 and CARM1, and recruits them to promoters.
+-!- INTERACTION:
+    P04637; P04637: TP53; NbExp=5; IntAct=EBI-366083, EBI-366083;
+    P04637; Q00987: MDM2; NbExp=40; IntAct=EBI-366083, EBI-389668;
+-!- DISEASE: Li-Fraumeni syndrome (LFS) [MIM:151623]: Autosomal dominant
+    familial cancer syndrome that in its classic form is defined by the
+    existence of a proband affected by a sarcoma before 45 years with a
+    first degree relative affected by any tumor before 45 years and another
+    first degree relative with any tumor before 45 years or a sarcoma at any
+    age. {ECO:0000269|PubMed:1565144, ECO:0000269|PubMed:1933902}. Note=The
+    disease is caused by variants affecting the gene represented in this
+    entry.
+-!- SIMILARITY: Belongs to the p53 family. {ECO:0000305}.
+""",
+]
+
+
+# the character by character tokenizer that Databank._get_words replaced
+def get_words_legacy(text: str) -> List[str]:
+    words = {}
+
+    i = 0
+    word = ""
+    while i < len(text):
+        if text[i].isalpha() or text[i].isdigit():
+            word += text[i]
+
+        elif len(word) >= 3 and len(word) < 20:
+            words[word.lower()] = None
+            word = ""
+
+        i += 1
+
+    return list(words)
+
+
+arg_parser = ArgumentParser(description="compare the speed of the word tokenizers on uniprot comment blocks")
+arg_parser.add_argument("--repeat", type=int, default=10000, help="number of times to tokenize every block")
+
+
+if __name__ == "__main__":
+
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    legacy_seconds = timeit(lambda: [get_words_legacy(text) for text in CC_BLOCKS], number=args.repeat)
+    current_seconds = timeit(lambda: [Databank._get_words(text) for text in CC_BLOCKS], number=args.repeat)
+
+    call_count = args.repeat * len(CC_BLOCKS)
+    logging.info(f"legacy tokenizer: {1e6 * legacy_seconds / call_count:.1f} us per block")
+    logging.info(f"current tokenizer: {1e6 * current_seconds / call_count:.1f} us per block")
+    logging.info(f"speedup: {legacy_seconds / current_seconds:.1f}x")
+
+    for text in CC_BLOCKS:
+        legacy_words = set(get_words_legacy(text))
+        current_words = set(Databank._get_words(text))
+
+        logging.info(f"{len(current_words)} words, {len(current_words - legacy_words)} missed by the legacy tokenizer")
@@ -0,0 +1,57 @@
+import sys
+import os
+import logging
+from argparse import ArgumentParser
+from time import time
+from typing import Dict
+
+from pdbecif.mmcif_tools import MMCIF2Dict
+
+root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_path)
+from prs.indexers.cif import read_mmcif
+from prs.indexers.mmcif import MMCIF_CATEGORIES
+
+
+# Leaves out what index_mmcif doesn't read, so that it can be compared with read_mmcif's output.
+def select_categories(mmcif_dict: Dict[str, Dict]) -> Dict[str, Dict]:
+    selected = {}
+    for category, items in mmcif_dict.items():
+        if category in MMCIF_CATEGORIES:
+            selection = MMCIF_CATEGORIES[category]
+            selected[category] = {item: value for item, value in items.items() if selection is None or item in selection}
+
+    return selected
+
+
+arg_parser = ArgumentParser(description="check that read_mmcif gives the same data as MMCIF2Dict")
+arg_parser.add_argument("cif_paths", nargs="+")
+
+
+if __name__ == "__main__":
+
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    reference_seconds = 0.0
+    reader_seconds = 0.0
+    difference_count = 0
+
+    for cif_path in args.cif_paths:
+        start = time()
+        reference = {heading: select_categories(block) for heading, block in MMCIF2Dict().parse(cif_path).items()}
+        reference_seconds += time() - start
+
+        start = time()
+        result = dict(read_mmcif(cif_path, MMCIF_CATEGORIES))
+        reader_seconds += time() - start
+
+        if result != reference:
+            logging.error(f"{cif_path}: read_mmcif differs from MMCIF2Dict")
+            difference_count += 1
+
+    logging.info(f"MMCIF2Dict: {reference_seconds:.2f} s, read_mmcif: {reader_seconds:.2f} s")
+    logging.info(f"{difference_count} of {len(args.cif_paths)} files differ")
+
+    sys.exit(1 if difference_count > 0 else 0)
@@ -1,34 +1,159 @@
 import sys
 import os
 import logging
+from argparse import ArgumentParser
 from glob import glob
 
 root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, root_path)
-from prs.indexers.uniprot import index_uniprot
-from prs.indexers.mmcif import index_mmcif
-from prs.models.databank import Databank
+from prs.indexers.uniprot import index_uniprot_file, index_uniprot_parallel
+from prs.indexers.mmcif import index_mmcif_files, index_mmcif_parallel
+from prs.indexers.quarantine import Quarantine
+from prs.models.databank import Databank, DatabankGroup, DEFAULT_CHECKPOINT_INTERVAL, DEFAULT_PROGRESS_INTERVAL
+from prs.models.manifest import compare_files
+from prs.models.kmers import DEFAULT_KMER_LENGTH, MAX_KMER_LENGTH
+
+
+arg_parser = ArgumentParser(description="index the databanks")
+arg_parser.add_argument("data_path")
+arg_parser.add_argument("--workers", type=int, default=1, help="number of processes to index with")
+arg_parser.add_argument("--staged", action="store_true", help="load every build into tables of its own and swap them in")
+arg_parser.add_argument("--pipelined", action="store_true", help="stream the rows to the database during indexing, implies --staged")
+arg_parser.add_argument("--update", action="store_true", help="only index the files that changed since the last build")
+arg_parser.add_argument("--work-directory", help="keep the spools and checkpoints in here, to resume failed builds from")
+arg_parser.add_argument("--checkpoint-interval", type=float, default=DEFAULT_CHECKPOINT_INTERVAL,
+                        help="least number of seconds between checkpoints")
+arg_parser.add_argument("--progress-interval", type=float, default=DEFAULT_PROGRESS_INTERVAL,
+                        help="least number of seconds between progress logs")
+arg_parser.add_argument("--key-counts", action="store_true", help="also count the rows of every key")
+arg_parser.add_argument("--metrics", metavar="DIR", help="write the summary of every databank to a JSON file in here")
+arg_parser.add_argument("--compact", action="store_true", help="store numbers for the entries, keys and words, see install_database.py")
+arg_parser.add_argument("--kmer-length", type=int, nargs="?", const=DEFAULT_KMER_LENGTH,
+                        help=f"also index the k-mers of this length of the sequences, for similarity searches, {DEFAULT_KMER_LENGTH} when left out")
+arg_parser.add_argument("--sequence-directory", metavar="DIR", help="also store the sequences of every databank in a file in here")
+arg_parser.add_argument("--deduplicate-sequences", action="store_true",
+                        help="refer to the sequences by hash, see install_database.py")
+arg_parser.add_argument("--quarantine", metavar="DIR", help="put the records that fail to index in here, instead of failing")
 
 
 if __name__ == "__main__":
 
-    data_path = sys.argv[1]
+    args = arg_parser.parse_args()
+    data_path = args.data_path
 
     logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
 
-    with Databank("sprot") as db:
-        with open(os.path.join(data_path, "uniprot/uniprot_sprot.dat"), 'rt') as f:
-            index_uniprot(f, db)
+    if args.update and (args.staged or args.pipelined):
+        arg_parser.error("updates go into the published tables, they cannot be staged")
+
+    if args.work_directory is not None and args.pipelined:
+        arg_parser.error("pipelined builds stream their rows away, they cannot be resumed")
+
+    if args.sequence_directory is not None and args.pipelined:
+        arg_parser.error("pipelined builds stream their sequences away, they cannot be stored in a file")
+
+    if args.deduplicate_sequences and args.pipelined:
+        arg_parser.error("pipelined builds stream into their own tables, they cannot share sequences")
+
+    if args.kmer_length is not None and not 1 <= args.kmer_length <= MAX_KMER_LENGTH:
+        arg_parser.error(f"--kmer-length must be 1 to {MAX_KMER_LENGTH}")
+
+    if args.work_directory is not None and args.compact:
+        arg_parser.error("compact builds number their rows in memory, they cannot be resumed")
+
+    databank_options = dict(staged=args.staged or args.pipelined, pipelined=args.pipelined,
+                            work_directory=args.work_directory, checkpoint_interval=args.checkpoint_interval,
+                            progress_interval=args.progress_interval, key_counts=args.key_counts,
+                            metrics_directory=args.metrics, compact=args.compact,
+                            kmer_length=args.kmer_length, sequence_directory=args.sequence_directory,
+                            deduplicate_sequences=args.deduplicate_sequences)
+
+    quarantine = Quarantine(args.quarantine) if args.quarantine is not None else None
+
+    def index_uniprot_path(path: str, databank: Databank, start: int):
+        if args.workers > 1:
+            index_uniprot_parallel(path, databank, args.workers, start=start, quarantine=quarantine)
+        else:
+            index_uniprot_file(path, databank, start, quarantine=quarantine)
+
+    sprot_path = os.path.join(data_path, "uniprot/uniprot_sprot.dat")
+    trembl_path = os.path.join(data_path, "uniprot/uniprot_trembl.dat")
+
+    # The UniProt entries are not kept by file, so a change to either file means a new build.
+    uniprot_files = Databank.load_files("uniprot") if args.update else {}
+    changed_records, touched_records, removed_paths = compare_files(uniprot_files, [sprot_path, trembl_path])
+    if len(changed_records) > 0 or len(removed_paths) > 0:
+
+        uniprot_files.update({record.path: record for record in changed_records + touched_records})
+
+        with Databank("uniprot", **databank_options) as uniprot_db:
+            state = uniprot_db.resume_state or {'path': sprot_path, 'offset': 0}
+            if state['path'] not in (sprot_path, trembl_path):
+                raise ValueError(f"the uniprot checkpoint is of {state['path']}, remove {args.work_directory} to start over")
+
+            # Swiss-Prot is parsed once, for both databanks.
+            if state['path'] == sprot_path:
+                with Databank("sprot", **databank_options) as sprot_db:
+                    if sprot_db.resume_state != uniprot_db.resume_state:
+                        raise ValueError(f"the sprot and uniprot checkpoints differ, remove {args.work_directory} to start over")
+
+                    index_uniprot_path(sprot_path, DatabankGroup(sprot_db, uniprot_db), state['offset'])
+
+                    sprot_db.record_file(uniprot_files[sprot_path])
+
+                # From here on, a resumed build must not go through Swiss-Prot again.
+                state = {'path': trembl_path, 'offset': 0}
+                uniprot_db.checkpoint(state, force=True)
+
+            index_uniprot_path(trembl_path, uniprot_db, state['offset'])
+
+            uniprot_db.record_file(uniprot_files[sprot_path])
+            uniprot_db.record_file(uniprot_files[trembl_path])
+    else:
+        logging.info("uniprot is up to date")
+
+    # Without published builds to update, the PDB is built from scratch, like UniProt.
+    pdb_update = args.update and all(Databank.get_published_id(name) is not None for name in ("pdb_atom", "pdb_seqres"))
+    if args.update and not pdb_update:
+        logging.info("pdb has no published builds to update, building it")
+
+    with Databank("pdb_atom", update=pdb_update, **databank_options) as atom_database:
+        with Databank("pdb_seqres", update=pdb_update, **databank_options) as seqres_database:
+            databanks = DatabankGroup(atom_database, seqres_database)
+
+            cif_paths = sorted(glob(os.path.join(data_path, "mmCIF/????.cif.gz")))
+
+            changed_records, touched_records, removed_paths = compare_files(atom_database.files, cif_paths)
+            logging.info(f"pdb: {len(changed_records)} new or changed files, {len(removed_paths)} removed files")
+
+            # The files that were indexed before the checkpoint are skipped.
+            resumed_entry_ids = (atom_database.resume_state or {}).get('entry_ids')
+            if resumed_entry_ids != (seqres_database.resume_state or {}).get('entry_ids'):
+                raise ValueError(f"the pdb_atom and pdb_seqres checkpoints differ, remove {args.work_directory} to start over")
+
+            changed_paths = [record.path for record in changed_records]
+            if args.workers > 1:
+                entry_ids = index_mmcif_parallel(changed_paths, atom_database, seqres_database, args.workers,
+                                                 quarantine=quarantine, entry_ids=resumed_entry_ids)
+            else:
+                entry_ids = index_mmcif_files(changed_paths, atom_database, seqres_database,
+                                              quarantine=quarantine, entry_ids=resumed_entry_ids)
+
+            for record in changed_records:
+                # Quarantined files are left unrecorded, so that the next update tries them again.
+                if entry_ids[record.path] is not None:
+                    record.entry_ids = entry_ids[record.path]
+                    databanks.record_file(record)
 
-    with Databank("uniprot") as db:
-        with open(os.path.join(data_path, "uniprot/uniprot_sprot.dat"), 'rt') as f:
-            index_uniprot(f, db)
+            for record in touched_records:
+                databanks.record_file(record)
 
-        with open(os.path.join(data_path, "uniprot/uniprot_trembl.dat"), 'rt') as f:
-            index_uniprot(f, db)
+            for path in removed_paths:
+                databanks.remove_file(path)
 
-    with Databank("pdb_atom") as atom_database:
-        with Databank("pdb_seqres") as seqres_database:
-            for cif_path in glob(os.path.join(data_path, "mmCIF/????.cif.gz")):
-                index_mmcif(cif_path, atom_database, seqres_database)
+    # The replaced builds may have been the last to refer to some sequences.
+    if args.deduplicate_sequences:
+        Databank.remove_unused_sequences()
 
+    if quarantine is not None:
+        quarantine.log_counts()
@@ -1,6 +1,7 @@
 import logging
 import os
 import sys
+from argparse import ArgumentParser
 
 root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, root_path)
@@ -8,37 +9,78 @@ sys.path.insert(0, root_path)
 from prs.storage import storage
 
 
+arg_parser = ArgumentParser(description="create the tables of the databanks")
+arg_parser.add_argument("--deduplicate-sequences", action="store_true",
+                        help="store every sequence once, for databanks indexed with --deduplicate-sequences")
+arg_parser.add_argument("--compact", action="store_true", help="number the entries, keys and words, for databanks indexed with --compact")
+
+
 if __name__ == "__main__":
 
+    args = arg_parser.parse_args()
+
     logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
 
-    connection = storage.connect()
-    cursor = connection.cursor()
+    if args.compact:
+        entry_type, key_type, word_type = "integer", "smallint", "integer"
+    else:
+        entry_type, key_type, word_type = "char(50)", "char(50)", "char(50)"
+
+    with storage.connection() as connection:
+        cursor = connection.cursor()
+
+        # kmer_length is that of the k-mers in kmers_entries, null for the builds without them.
+        cursor.execute("create table databanks(id serial primary key, name char(50) not null, date timestamp not null default current_timestamp, kmer_length smallint)")
+
+        # The files that the published build of a databank was indexed from, for updating it.
+        # Files are only hashed when an update finds them changed, see compare_files.
+        cursor.execute("create table databank_files(databank_id integer not null references databanks(id) on delete cascade, path text not null, size bigint not null, mtime double precision not null, hash char(64), entry_ids text[] not null, primary key (databank_id, path))")
+
+        # The compact schema keeps every key and word once, the other tables refer to them by id.
+        # The entries are numbered per build, links keep the entry ids as text.
+        if args.compact:
+            cursor.execute("create table keys(id smallint primary key, key text not null unique)")
+            cursor.execute("create table words(id integer primary key, word text not null unique)")
+
+            cursor.execute("create table entries(databank_id serial references databanks(id), id integer not null, entry_id text not null) partition by list (databank_id)")
+            cursor.execute("create unique index on entries using btree(databank_id, id)")
+            cursor.execute("create unique index on entries using btree(databank_id, entry_id)")
 
-    cursor.execute("create table databanks(id serial primary key, name char(50) not null, date timestamp not null default current_timestamp)")
+        # Every build of a databank gets a partition of its own in these tables, see Databank.
+        # With deduplicated sequences, the entries refer to the sequences table by the hash of their sequence.
+        # All builds of all databanks share it, which also finds the entries with the same sequence by their hash.
+        if args.deduplicate_sequences:
+            cursor.execute("create table sequences(hash char(32) primary key, sequence text not null)")
 
-    cursor.execute("create table entries_sequences(databank_id serial references databanks(id), entry_id char(50) not null, sequence text not null)")
-    cursor.execute("create unique index on entries_sequences using btree(databank_id, entry_id)")
+            cursor.execute(f"create table entries_sequences(databank_id serial references databanks(id), entry_id {entry_type} not null, hash char(32) not null) partition by list (databank_id)")
+            cursor.execute("create index on entries_sequences using btree(hash)")
+        else:
+            cursor.execute(f"create table entries_sequences(databank_id serial references databanks(id), entry_id {entry_type} not null, sequence text not null) partition by list (databank_id)")
+        cursor.execute("create unique index on entries_sequences using btree(databank_id, entry_id)")
 
-    cursor.execute("create table words_entries(databank_id serial references databanks(id), entry_id char(50) not null, key char(50) not null, word char(50) not null)")
-    cursor.execute("create index on words_entries using btree(key, word)")
-    cursor.execute("create index on words_entries using btree(word)")
+        # The indexes of the values end in the entry ids, so that searches can look the entries up and page through
+        # the entries of a value in order, see Query.
+        cursor.execute(f"create table words_entries(databank_id serial references databanks(id), entry_id {entry_type} not null, key {key_type} not null, word {word_type} not null) partition by list (databank_id)")
+        cursor.execute("create index on words_entries using btree(key, word, entry_id)")
+        cursor.execute("create index on words_entries using btree(word, entry_id)")
 
-    cursor.execute("create table strings_entries(databank_id serial references databanks(id), entry_id char(50) not null, key char(50) not null, string text not null)")
-    cursor.execute("create index on strings_entries using btree(key, string)")
+        cursor.execute(f"create table strings_entries(databank_id serial references databanks(id), entry_id {entry_type} not null, key {key_type} not null, string text not null) partition by list (databank_id)")
+        cursor.execute("create index on strings_entries using btree(key, string, entry_id)")
 
-    cursor.execute("create table unique_strings_entries(databank_id serial references databanks(id), entry_id char(50) not null, key char(50) not null, string text not null)")
-    cursor.execute("create index on unique_strings_entries using btree(key, string)")
-    cursor.execute("create unique index on unique_strings_entries using btree(databank_id, key, string)")
+        cursor.execute(f"create table unique_strings_entries(databank_id serial references databanks(id), entry_id {entry_type} not null, key {key_type} not null, string text not null) partition by list (databank_id)")
+        cursor.execute("create index on unique_strings_entries using btree(key, string, entry_id)")
+        cursor.execute("create unique index on unique_strings_entries using btree(databank_id, key, string)")
 
-    cursor.execute("create table numbers_entries(databank_id serial references databanks(id), entry_id char(50) not null, key char(50) not null, number float not null)")
-    cursor.execute("create index on numbers_entries using btree(key, number)")
+        cursor.execute(f"create table numbers_entries(databank_id serial references databanks(id), entry_id {entry_type} not null, key {key_type} not null, number float not null) partition by list (databank_id)")
+        cursor.execute("create index on numbers_entries using btree(key, number, entry_id)")
 
-    cursor.execute("create table dates_entries(databank_id serial references databanks(id), entry_id char(50) not null, key char(50) not null, date date not null)")
-    cursor.execute("create index on dates_entries using btree(key, date)")
+        cursor.execute(f"create table dates_entries(databank_id serial references databanks(id), entry_id {entry_type} not null, key {key_type} not null, date date not null) partition by list (databank_id)")
+        cursor.execute("create index on dates_entries using btree(key, date, entry_id)")
 
-    cursor.execute("create table links(databank1_id serial references databanks(id), entry1_id char(50) not null, databank2_id serial references databanks(id), entry2_id char(50) not null)")
-    cursor.execute("create index on links using btree(databank1_id, entry1_id)")
-    cursor.execute("create index on links using btree(databank2_id, entry2_id)")
+        # Only filled for databanks that are indexed with a k-mer index, see index.py --kmer-length.
+        cursor.execute(f"create table kmers_entries(databank_id serial references databanks(id), entry_id {entry_type} not null, kmer integer not null) partition by list (databank_id)")
+        cursor.execute("create index on kmers_entries using btree(kmer, entry_id)")
 
-    connection.commit()
+        cursor.execute("create table links(databank1_id serial references databanks(id), entry1_id char(50) not null, databank2_id serial references databanks(id), entry2_id char(50) not null) partition by list (databank1_id)")
+        cursor.execute("create index on links using btree(databank1_id, entry1_id)")
+        cursor.execute("create index on links using btree(databank2_id, entry2_id)")
@@ -0,0 +1,29 @@
+import sys
+import os
+import logging
+from argparse import ArgumentParser
+
+root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_path)
+from prs.models.query import Query, DEFAULT_PAGE_SIZE
+
+
+arg_parser = ArgumentParser(description="search a databank, for example: search.py pdb_seqres 'title:kinase AND resolution<2.0'")
+arg_parser.add_argument("databank_name")
+arg_parser.add_argument("query")
+arg_parser.add_argument("--offset", type=int, default=0, help="number of entries to skip")
+arg_parser.add_argument("--limit", type=int, default=DEFAULT_PAGE_SIZE, help="number of entries to list")
+
+
+if __name__ == "__main__":
+
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    result = Query(args.databank_name).search(args.query, args.offset, args.limit)
+
+    for entry_id in result.entry_ids:
+        print(entry_id)
+
+    logging.info(f"{result.offset + len(result.entry_ids)} of {'' if result.exact else 'at least '}{result.total} entries")
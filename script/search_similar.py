@@ -0,0 +1,33 @@
+import sys
+import os
+import logging
+from argparse import ArgumentParser
+
+root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_path)
+from prs.models.kmers import DEFAULT_BAND_WIDTH
+from prs.models.similarity import search_similar, DEFAULT_HIT_COUNT, DEFAULT_CANDIDATE_COUNT, RESCORE_METHODS
+
+
+arg_parser = ArgumentParser(description="find the sequences of a databank that are like a sequence, by their k-mers")
+arg_parser.add_argument("databank_name")
+arg_parser.add_argument("sequence")
+arg_parser.add_argument("--hits", type=int, default=DEFAULT_HIT_COUNT, help="number of entries to list")
+arg_parser.add_argument("--rescore", choices=RESCORE_METHODS, help="rank the candidates by an alignment")
+arg_parser.add_argument("--candidates", type=int, default=DEFAULT_CANDIDATE_COUNT, help="number of candidates to rescore")
+arg_parser.add_argument("--band-width", type=int, default=DEFAULT_BAND_WIDTH, help="for banded rescoring")
+
+
+if __name__ == "__main__":
+
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    hits = search_similar(args.databank_name, args.sequence, args.hits, args.rescore, args.candidates, args.band_width)
+
+    for hit in hits:
+        if hit.score is None:
+            print(f"{hit.entry_id}\t{hit.shared_kmers}")
+        else:
+            print(f"{hit.entry_id}\t{hit.shared_kmers}\t{hit.score}")